@@ -0,0 +1,52 @@
+################################################################################
+# SafeNest Hypanel Webhook Receiver - Gunicorn Configuration
+#
+# Production WSGI server for src/hypanel_webhook_receiver.py. Replaces the
+# single-process Flask development server with keep-alive connections and
+# multiple worker processes. nginx proxies /device/ to the unix socket below
+# (see config/nginx_safenest_webhook.conf).
+#
+# Usage (from /opt/safenest/src):
+#   gunicorn -c /opt/safenest/config/gunicorn.conf.py hypanel_webhook_receiver:app
+################################################################################
+
+import multiprocessing
+import os
+import sys
+
+# === BIND ===
+# Unix socket for nginx (systemd RuntimeDirectory=safenest creates /run/safenest)
+bind = [os.environ.get("WEBHOOK_BIND", "unix:/run/safenest/webhook.sock")]
+
+# Socket is shared with the nginx group (Group=www-data in the unit file)
+umask = 0o007
+
+# === WORKERS ===
+workers = int(os.environ.get("WEBHOOK_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gthread"
+threads = 4
+
+# Keep Hypanel/nginx connections open between webhooks (no TIME_WAIT churn)
+keepalive = 30
+timeout = 30
+
+# === LOGGING ===
+accesslog = "-"
+errorlog = "-"
+loglevel = "info"
+
+
+def post_fork(server, worker):
+    """Give every worker its own receiver and MQTT connection."""
+    import hypanel_webhook_receiver
+
+    # Broker drops duplicate client IDs, so suffix with the worker PID.
+    # Connect in the background so a slow broker can't hold the worker past
+    # gunicorn's timeout; webhooks get 503 until the connection is up.
+    if not hypanel_webhook_receiver.init_receiver(
+        client_id=f"hypanel_bridge_{worker.pid}",
+        wait_for_broker=False
+    ):
+        server.log.error("Worker %s failed to start webhook receiver", worker.pid)
+        # Exit so the arbiter replaces the worker instead of serving without MQTT
+        sys.exit(1)
@@ -0,0 +1,37 @@
+################################################################################
+# SafeNest Web Dashboard - Gunicorn Configuration
+#
+# Production WSGI server for src/web_dashboard.py. Serves page loads and the
+# /state polling endpoint from a thread pool, so one slow client or render
+# does not hold up the others.
+#
+# Usage (from /opt/safenest/src):
+#   gunicorn -c /opt/safenest/config/gunicorn_dashboard.conf.py web_dashboard:app
+################################################################################
+
+import os
+
+# === BIND ===
+bind = [f"0.0.0.0:{os.environ.get('DASHBOARD_PORT', '5000')}"]
+
+# === WORKERS ===
+# Device state lives in the process and is fed by its MQTT listener thread,
+# so run a single worker and scale with threads
+workers = 1
+worker_class = "gthread"
+threads = int(os.environ.get("DASHBOARD_THREADS", "4"))
+
+keepalive = 30
+timeout = 30
+
+# === LOGGING ===
+accesslog = "-"
+errorlog = "-"
+loglevel = "info"
+
+
+def post_fork(server, worker):
+    """Start the MQTT listener inside the worker that serves requests."""
+    import web_dashboard
+
+    web_dashboard.start_mqtt_listener()
@@ -77,6 +77,7 @@ apt-get install -y \
     openssl \
     iptables \
     iptables-persistent \
+    ipset \
     git
 
 echo ""
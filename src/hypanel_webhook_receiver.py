@@ -26,6 +26,9 @@ Examples:
 Usage:
     python3 hypanel_webhook_receiver.py
 
+    Production (gunicorn behind nginx):
+    gunicorn -c ../config/gunicorn.conf.py hypanel_webhook_receiver:app
+
 The service runs on port 9000 by default.
 
 Author: SafeNest Security Team
@@ -35,11 +38,13 @@ Version: 1.0.0
 import sys
 import json
 import signal
+import time
+import functools
 from pathlib import Path
 from flask import Flask, request, jsonify
 import os
-from datetime import datetime
-from threading import Thread
+from collections import deque
+from threading import Event, Lock, Thread
 
 # Add modules directory to path
 sys.path.insert(0, str(Path(__file__).parent))
@@ -60,14 +65,71 @@ RASPBERRY_PI_IP = "192.168.1.10"  # Your Raspberry Pi IP
 MQTT_BROKER_HOST = "localhost"
 MQTT_BROKER_PORT = 1883
 
+# Publish batching (coalesce webhook bursts into one flush)
+PUBLISH_FLUSH_INTERVAL = 0.005  # Seconds to coalesce a burst before flushing
+PUBLISH_MAX_BATCH = 64  # Flush without waiting once this many publishes are pending
+
+# Drop repeated identical states within this window (Zigbee devices resend);
+# applies to */state topics only, never to events
+DEDUP_WINDOW_S = float(os.environ.get("WEBHOOK_DEDUP_WINDOW", "1.5"))
+
+
+# Map device types to MQTT topics
+_TOPIC_MAP = {
+    "motion": "safenest/motion/state",
+    "light1": "safenest/light1/state",
+    "light2": "safenest/light2/state",
+    "intercom": "safenest/intercom/event"
+}
+
+# Map common state variations to normalized MQTT states
+_STATE_MAP = {
+    # Motion sensor states
+    "detected": "motion_detected",
+    "motion_detected": "motion_detected",
+    "motion": "motion_detected",
+    "active": "motion_detected",
+    "idle": "idle",
+    "clear": "idle",
+    "no_motion": "idle",
+
+    # Light states
+    "on": "ON",
+    "true": "ON",
+    "1": "ON",
+    "off": "OFF",
+    "false": "OFF",
+    "0": "OFF",
+
+    # Intercom events
+    "call": "call_button_pressed",
+    "call_button_pressed": "call_button_pressed",
+    "doorbell": "call_button_pressed",
+    "pressed": "call_button_pressed",
+    "door_opened": "door_opened",
+    "opened": "door_opened",
+    "open": "door_opened"
+}
+
+
+@functools.lru_cache(maxsize=128)
+def _normalize_state(raw: str) -> str:
+    """Map a raw Hypanel state to its MQTT state (cached; inputs are few)."""
+    return _STATE_MAP.get(raw.strip().lower(), raw)
+
 
 class HypanelWebhookReceiver:
     """
     Receives webhooks from Hypanel and publishes to MQTT.
     """
 
-    def __init__(self):
-        """Initialize the webhook receiver."""
+    def __init__(self, client_id: str = "hypanel_bridge"):
+        """
+        Initialize the webhook receiver.
+
+        Args:
+            client_id: MQTT client identifier (must be unique per process)
+        """
         global logger, mqtt_client
 
         self.logger = get_logger(
@@ -81,7 +143,7 @@ class HypanelWebhookReceiver:
 
         # Initialize MQTT client (non-TLS for local connection)
         self.mqtt_client = SecureMQTTClient(
-            client_id="hypanel_bridge",
+            client_id=client_id,
             broker_host=MQTT_BROKER_HOST,
             broker_port=MQTT_BROKER_PORT,
             username=None,
@@ -99,109 +161,264 @@ class HypanelWebhookReceiver:
             "intercom": "idle"
         }
 
-    def start(self):
-        """Start the webhook receiver service."""
+        # Monotonic time of the last publish per device (for deduplication)
+        self.last_seen = {}
+
+        # Guards device_states and last_seen; webhook handlers run concurrently
+        self.state_lock = Lock()
+
+        # Pending (topic, payload) publishes drained by the flusher thread
+        self._pending = deque()
+        self._pending_lock = Lock()
+        self._flush_event = Event()
+
+    def start(self, wait_for_broker: bool = True):
+        """
+        Start the webhook receiver service.
+
+        Args:
+            wait_for_broker: Block until the MQTT broker accepts the
+                connection. When False (gunicorn workers) the connection is
+                made by a background thread and webhooks are answered with
+                503 until it is up, so worker start-up is not held past
+                gunicorn's timeout.
+        """
         self.logger.info("Starting Hypanel Webhook Receiver...")
 
-        # Connect to MQTT broker
+        # Start background publisher before any webhook can be queued
+        Thread(target=self._flush_loop, daemon=True).start()
+
+        if wait_for_broker:
+            if not self._connect():
+                return False
+        else:
+            Thread(target=self._connect, daemon=True).start()
+
+        self.logger.info(f"Webhook receiver ready on port {WEBHOOK_PORT}")
+        self.logger.info(f"Configure Hypanel to send webhooks to: http://{RASPBERRY_PI_IP}:{WEBHOOK_PORT}/device/<device_name>")
+
+        return True
+
+    def _connect(self) -> bool:
+        """Connect to the MQTT broker, retrying until it is reachable."""
         if not self.mqtt_client.connect(retry=True, retry_interval=5, max_retries=-1):
             self.logger.critical("Failed to connect to MQTT broker. Exiting.")
             return False
 
         self.logger.info("Connected to MQTT broker successfully")
-        self.logger.info(f"Webhook receiver ready on port {WEBHOOK_PORT}")
-        self.logger.info(f"Configure Hypanel to send webhooks to: http://{RASPBERRY_PI_IP}:{WEBHOOK_PORT}/device/<device_name>")
-
         return True
 
+    def enqueue_publish(self, topic: str, payload: str):
+        """
+        Queue an MQTT publish for the flusher thread.
+
+        Args:
+            topic: MQTT topic
+            payload: Message payload
+        """
+        self._pending.append((topic, payload))
+        self._flush_event.set()
+
+    def _flush_loop(self):
+        """
+        Publish queued messages in batches.
+
+        Sleeps until the first publish is queued, then waits
+        PUBLISH_FLUSH_INTERVAL so the rest of a webhook burst joins the same
+        batch (skipped once PUBLISH_MAX_BATCH publishes are already pending).
+        """
+        while True:
+            self._flush_event.wait()
+            if len(self._pending) < PUBLISH_MAX_BATCH:
+                time.sleep(PUBLISH_FLUSH_INTERVAL)
+            self._flush_event.clear()
+            self.flush()
+
+    def flush(self):
+        """Publish all pending messages."""
+        with self._pending_lock:
+            # popleft() rather than clear() so concurrent appends aren't lost
+            batch = [self._pending.popleft() for _ in range(len(self._pending))]
+
+        for topic, payload in batch:
+            self.mqtt_client.publish(topic, payload)
+
+    def handle_device_event(self, device_type: str, state: str, event_data: dict = None,
+                            mqtt_topic: str = None):
+        """
+        Handle device event from Hypanel and publish to MQTT.
+
+        Args:
+            device_type: Type of device (motion, light1, light2, intercom)
+            state: Device state (detected/idle, ON/OFF, etc.)
+            event_data: Additional event data from webhook
+            mqtt_topic: Precomputed MQTT topic (looked up from device_type if None)
+        """
+        # Normalize device type (as for the topic lookup) and state, so
+        # /device/Light1 and /device/light1 share dedup and state entries
+        device_type = device_type.lower()
+        mqtt_state = _normalize_state(state)
+
+        # Get MQTT topic for this device
+        if mqtt_topic is None:
+            mqtt_topic = _TOPIC_MAP.get(device_type)
+
+        if not mqtt_topic:
+            self.logger.warning(f"Unknown device type: {device_type}")
+            return False
 
-# Global receiver instance
-receiver = None
+        # Update internal state tracking, skipping duplicate webhooks. Only
+        # state topics are deduplicated: on event topics (intercom) every
+        # webhook is a distinct event, e.g. two doorbell presses
+        now = time.monotonic()
+        is_state = mqtt_topic.endswith("/state")
+        with self.state_lock:
+            if (is_state
+                    and self.device_states.get(device_type) == mqtt_state
+                    and now - self.last_seen.get(device_type, 0.0) < DEDUP_WINDOW_S):
+                self.logger.debug(f"Duplicate state dropped: {device_type} = {mqtt_state}")
+                return True
+
+            self.last_seen[device_type] = now
+            if device_type in self.device_states:
+                self.device_states[device_type] = mqtt_state
+
+        # Publish to MQTT
+        self.logger.info(f"Publishing: {mqtt_topic} = {mqtt_state}")
+        self.enqueue_publish(mqtt_topic, mqtt_state)
+
+        # Log event details
+        self.logger.info(
+            f"Device event received",
+            device=device_type,
+            state=mqtt_state,
+            source="hypanel"
+        )
 
+        return True
 
-def handle_device_event(device_type: str, state: str, event_data: dict = None):
-    """
-    Handle device event from Hypanel and publish to MQTT.
+    def webhook_device(self, device_type):
+        """
+        Receive device event webhook from Hypanel.
+
+        URL Parameters:
+            device_type: Type of device (motion, light1, light2, intercom)
+
+        Query Parameters:
+            state: Device state (detected, idle, ON, OFF, etc.)
+            event: Event name (for intercom: call_button_pressed, door_opened)
+
+        Examples:
+            GET /device/motion?state=detected
+            GET /device/light1?state=ON
+            GET /device/intercom?event=call_button_pressed
+            POST /device/motion (with JSON body)
+        """
+        return self._handle_webhook(device_type, None)
+
+    def _handle_webhook(self, device_type: str, mqtt_topic: str = None):
+        """
+        Parse the current request and handle it as a device event.
+
+        Args:
+            device_type: Type of device from the URL
+            mqtt_topic: Precomputed MQTT topic for explicitly routed devices
+        """
+        # Refuse rather than accept events that cannot be published
+        if not self.mqtt_client.connected:
+            self.logger.warning(f"MQTT broker not connected, rejecting webhook: {device_type}")
+            return jsonify({
+                "status": "error",
+                "device": device_type,
+                "message": "MQTT broker not connected"
+            }), 503
 
-    Args:
-        device_type: Type of device (motion, light1, light2, intercom)
-        state: Device state (detected/idle, ON/OFF, etc.)
-        event_data: Additional event data from webhook
-    """
-    global logger, mqtt_client, receiver
-
-    if not mqtt_client:
-        logger.error("MQTT client not initialized")
-        return False
-
-    # Map device types to MQTT topics
-    topic_mapping = {
-        "motion": "safenest/motion/state",
-        "light1": "safenest/light1/state",
-        "light2": "safenest/light2/state",
-        "intercom": "safenest/intercom/event"
-    }
+        try:
+            # Get state from JSON object body, else combined query/form
+            # parameters (invalid or non-object JSON falls back the same way)
+            values = request.get_json(silent=True)
+            if not values or not isinstance(values, dict):
+                values = request.values
+            state = values.get('state') or values.get('event') or 'unknown'
+            event_data = dict(values)
+
+            # Log received webhook
+            self.logger.info(f"Webhook received: {device_type} -> {state}")
+
+            # Handle the device event
+            success = self.handle_device_event(device_type, state, event_data, mqtt_topic)
+
+            if success:
+                return jsonify({
+                    "status": "success",
+                    "device": device_type,
+                    "state": state,
+                    "message": "Event published to MQTT"
+                }), 200
+            else:
+                return jsonify({
+                    "status": "error",
+                    "device": device_type,
+                    "message": "Failed to publish event"
+                }), 500
+
+        except Exception as e:
+            self.logger.error(f"Error handling webhook: {e}")
+            return jsonify({
+                "status": "error",
+                "message": str(e)
+            }), 500
 
-    # Normalize device state
-    normalized_state = state.strip().lower()
-
-    # Map common state variations
-    state_mapping = {
-        # Motion sensor states
-        "detected": "motion_detected",
-        "motion_detected": "motion_detected",
-        "motion": "motion_detected",
-        "active": "motion_detected",
-        "idle": "idle",
-        "clear": "idle",
-        "no_motion": "idle",
-
-        # Light states
-        "on": "ON",
-        "true": "ON",
-        "1": "ON",
-        "off": "OFF",
-        "false": "OFF",
-        "0": "OFF",
-
-        # Intercom events
-        "call": "call_button_pressed",
-        "call_button_pressed": "call_button_pressed",
-        "doorbell": "call_button_pressed",
-        "pressed": "call_button_pressed",
-        "door_opened": "door_opened",
-        "opened": "door_opened",
-        "open": "door_opened"
-    }
+    def register_routes(self, flask_app: Flask):
+        """
+        Register the device webhook routes as bound methods on flask_app.
+
+        Known devices get a static route with their MQTT topic bound in, so
+        Werkzeug matches them directly and no per-request topic lookup is
+        needed. The generic <device_type> route remains as a fallback.
+
+        Args:
+            flask_app: Flask application to add the routes to
+        """
+        for device_type, mqtt_topic in _TOPIC_MAP.items():
+            flask_app.add_url_rule(
+                f'/device/{device_type}',
+                endpoint=f'webhook_{device_type}',
+                view_func=functools.partial(self._handle_webhook, device_type, mqtt_topic),
+                methods=['GET', 'POST']
+            )
+
+        flask_app.add_url_rule(
+            '/device/<device_type>',
+            endpoint='webhook_device',
+            view_func=self.webhook_device,
+            methods=['GET', 'POST']
+        )
 
-    # Get normalized state
-    mqtt_state = state_mapping.get(normalized_state, state)
 
-    # Get MQTT topic for this device
-    mqtt_topic = topic_mapping.get(device_type.lower())
+# Global receiver instance
+receiver = None
 
-    if not mqtt_topic:
-        logger.warning(f"Unknown device type: {device_type}")
-        return False
 
-    # Update internal state tracking
-    if device_type in receiver.device_states:
-        receiver.device_states[device_type] = mqtt_state
+def init_receiver(client_id: str = "hypanel_bridge", wait_for_broker: bool = True) -> bool:
+    """
+    Create and start the global receiver instance.
 
-    # Publish to MQTT
-    logger.info(f"Publishing: {mqtt_topic} = {mqtt_state}")
-    mqtt_client.publish(mqtt_topic, mqtt_state)
+    Called from main() for the standalone server and from the gunicorn
+    post_fork hook so every worker process owns its own MQTT connection.
 
-    # Log event details
-    logger.info(
-        f"Device event received",
-        device=device_type,
-        state=mqtt_state,
-        source="hypanel",
-        timestamp=datetime.utcnow().isoformat()
-    )
+    Args:
+        client_id: MQTT client identifier for this process
+        wait_for_broker: Block until connected to MQTT (see start())
 
-    return True
+    Returns:
+        bool: True if the receiver started
+    """
+    global receiver
+
+    receiver = HypanelWebhookReceiver(client_id=client_id)
+    receiver.register_routes(app)
+    return receiver.start(wait_for_broker=wait_for_broker)
 
 
 @app.route('/', methods=['GET'])
@@ -225,68 +442,6 @@ def index():
     return jsonify(status), 200
 
 
-@app.route('/device/<device_type>', methods=['GET', 'POST'])
-def webhook_device(device_type):
-    """
-    Receive device event webhook from Hypanel.
-
-    URL Parameters:
-        device_type: Type of device (motion, light1, light2, intercom)
-
-    Query Parameters:
-        state: Device state (detected, idle, ON, OFF, etc.)
-        event: Event name (for intercom: call_button_pressed, door_opened)
-
-    Examples:
-        GET /device/motion?state=detected
-        GET /device/light1?state=ON
-        GET /device/intercom?event=call_button_pressed
-        POST /device/motion (with JSON body)
-    """
-    global logger
-
-    try:
-        # Get state from query parameters or JSON body
-        if request.method == 'GET':
-            state = request.args.get('state') or request.args.get('event') or 'unknown'
-            event_data = dict(request.args)
-        else:  # POST
-            if request.is_json:
-                data = request.get_json()
-                state = data.get('state') or data.get('event') or 'unknown'
-                event_data = data
-            else:
-                state = request.form.get('state') or request.form.get('event') or 'unknown'
-                event_data = dict(request.form)
-
-        # Log received webhook
-        logger.info(f"Webhook received: {device_type} -> {state}")
-
-        # Handle the device event
-        success = handle_device_event(device_type, state, event_data)
-
-        if success:
-            return jsonify({
-                "status": "success",
-                "device": device_type,
-                "state": state,
-                "message": "Event published to MQTT"
-            }), 200
-        else:
-            return jsonify({
-                "status": "error",
-                "device": device_type,
-                "message": "Failed to publish event"
-            }), 500
-
-    except Exception as e:
-        logger.error(f"Error handling webhook: {e}")
-        return jsonify({
-            "status": "error",
-            "message": str(e)
-        }), 500
-
-
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint."""
@@ -301,16 +456,12 @@ def signal_handler(signum, frame):
 
 def main():
     """Main entry point."""
-    global receiver
-
     # Register signal handlers
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
     # Create receiver instance
-    receiver = HypanelWebhookReceiver()
-
-    if not receiver.start():
+    if not init_receiver():
         print("Failed to start Hypanel Webhook Receiver", file=sys.stderr)
         sys.exit(1)
 
@@ -342,13 +493,14 @@ def main():
     print(f"\nTest webhook: curl http://{RASPBERRY_PI_IP}:{WEBHOOK_PORT}/device/motion?state=detected")
     print("="*70 + "\n")
 
-    # Start Flask web server
+    # Start Flask web server (standalone mode; production deployments run
+    # gunicorn with config/gunicorn.conf.py behind nginx instead)
     ports_to_try = [WEBHOOK_PORT, WEBHOOK_PORT + 1, WEBHOOK_PORT + 2]
     for port in ports_to_try:
         try:
             print(f"Binding webhook server to http://0.0.0.0:{port}")
             logger.info(f"Webhook server binding", port=port)
-            app.run(host='0.0.0.0', port=port, debug=False)
+            app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
             break
         except (OSError, SystemExit):
             logger.warning("Webhook port unavailable", port=port)
@@ -5,8 +5,11 @@ Provides high-level device control abstractions for lights, sensors,
 and other smart home devices in the SafeNest ecosystem.
 """
 
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from typing import Callable, Optional, Dict, Any
 from enum import Enum
+from modules import json_utils
 from modules.mqtt_client import SecureMQTTClient
 from modules.logging_utils import get_logger
 
@@ -26,6 +29,17 @@ class MotionState(Enum):
     UNKNOWN = "unknown"
 
 
+# Payload -> enum member lookups for MQTT state callbacks (no ValueError path)
+_DEVICE_STATES = DeviceState._value2member_map_
+_MOTION_STATES = MotionState._value2member_map_
+
+# Light command validation and per-light command topics
+_LIGHT_IDS = ("light1", "light2")
+_VALID_LIGHT_IDS = frozenset(_LIGHT_IDS)
+_VALID_LIGHT_STATES = frozenset({DeviceState.ON, DeviceState.OFF})
+_LIGHT_TOPICS = {light_id: f"safenest/{light_id}/set" for light_id in _VALID_LIGHT_IDS}
+
+
 class DeviceController:
     """
     High-level controller for SafeNest smart home devices.
@@ -47,6 +61,9 @@ class DeviceController:
             log_file=None
         )
 
+        # Worker pool for fanning out multi-device commands
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="device_controller")
+
         # Device state cache
         self.device_states: Dict[str, Any] = {
             "light1": DeviceState.UNKNOWN,
@@ -60,42 +77,36 @@ class DeviceController:
 
     def _subscribe_to_states(self):
         """Subscribe to all device state topics for tracking."""
-        self.mqtt.subscribe("safenest/light1/state", self._on_light1_state)
-        self.mqtt.subscribe("safenest/light2/state", self._on_light2_state)
+        self.mqtt.subscribe("safenest/light1/state", functools.partial(self._on_light_state, "light1"))
+        self.mqtt.subscribe("safenest/light2/state", functools.partial(self._on_light_state, "light2"))
         self.mqtt.subscribe("safenest/motion/state", self._on_motion_state)
         self.mqtt.subscribe("safenest/intercom/event", self._on_intercom_event)
 
-    def _on_light1_state(self, topic: str, payload: str):
-        """Callback for light 1 state updates."""
-        try:
-            self.device_states["light1"] = DeviceState(payload)
-            self.logger.info("Light 1 state updated", state=payload)
-        except ValueError:
-            self.logger.warning("Invalid light 1 state received", state=payload)
-            self.device_states["light1"] = DeviceState.UNKNOWN
-
-    def _on_light2_state(self, topic: str, payload: str):
-        """Callback for light 2 state updates."""
-        try:
-            self.device_states["light2"] = DeviceState(payload)
-            self.logger.info("Light 2 state updated", state=payload)
-        except ValueError:
-            self.logger.warning("Invalid light 2 state received", state=payload)
-            self.device_states["light2"] = DeviceState.UNKNOWN
+    def _on_light_state(self, light_id: str, topic: str, payload: str):
+        """Callback for light state updates (light_id bound at subscribe time)."""
+        state = _DEVICE_STATES.get(payload)
+        if state is None:
+            self.logger.warning("Invalid light state received", light=light_id, state=payload)
+            self.device_states[light_id] = DeviceState.UNKNOWN
+            return
+
+        self.device_states[light_id] = state
+        self.logger.info("Light state updated", light=light_id, state=payload)
 
     def _on_motion_state(self, topic: str, payload: str):
         """Callback for motion sensor state updates."""
-        try:
-            self.device_states["motion"] = MotionState(payload)
-            self.logger.info("Motion sensor state updated", state=payload)
-
-            # Trigger action on motion detection
-            if payload == MotionState.MOTION_DETECTED.value:
-                self._on_motion_detected()
-
-        except ValueError:
+        state = _MOTION_STATES.get(payload)
+        if state is None:
             self.logger.warning("Invalid motion state received", state=payload)
             self.device_states["motion"] = MotionState.UNKNOWN
+            return
+
+        self.device_states["motion"] = state
+        self.logger.info("Motion sensor state updated", state=payload)
+
+        # Trigger action on motion detection
+        if state is MotionState.MOTION_DETECTED:
+            self._on_motion_detected()
 
     def _on_intercom_event(self, topic: str, payload: str):
         """Callback for intercom events."""
@@ -137,19 +148,18 @@ class DeviceController:
         Returns:
             bool: True if command sent successfully
         """
-        if light_id not in ["light1", "light2"]:
+        if light_id not in _VALID_LIGHT_IDS:
             self.logger.error(f"Invalid light ID: {light_id}")
             return False
 
-        if state not in [DeviceState.ON, DeviceState.OFF]:
+        if state not in _VALID_LIGHT_STATES:
             self.logger.error(f"Invalid state for light: {state}")
             return False
 
-        topic = f"safenest/{light_id}/set"
         payload = state.value
 
-        self.logger.info(f"Setting {light_id} to {state.value}")
-        return self.mqtt.publish(topic, payload)
+        self.logger.info(f"Setting {light_id} to {payload}")
+        return self.mqtt.publish(_LIGHT_TOPICS[light_id], payload)
 
     def turn_on_light(self, light_id: str) -> bool:
         """Turn on a light."""
@@ -159,17 +169,15 @@ class DeviceController:
         """Turn off a light."""
         return self.set_light(light_id, DeviceState.OFF)
 
-    def turn_on_all_lights(self):
-        """Turn on all lights."""
+    def turn_on_all_lights(self) -> bool:
+        """Turn on all lights (commands are published concurrently)."""
         self.logger.info("Turning on all lights")
-        self.turn_on_light("light1")
-        self.turn_on_light("light2")
+        return all(self._pool.map(self.turn_on_light, _LIGHT_IDS))
 
-    def turn_off_all_lights(self):
-        """Turn off all lights."""
+    def turn_off_all_lights(self) -> bool:
+        """Turn off all lights (commands are published concurrently)."""
         self.logger.info("Turning off all lights")
-        self.turn_off_light("light1")
-        self.turn_off_light("light2")
+        return all(self._pool.map(self.turn_off_light, _LIGHT_IDS))
 
     def get_light_state(self, light_id: str) -> DeviceState:
         """
@@ -214,8 +222,7 @@ class DeviceController:
         if details:
             alert_data.update(details)
 
-        import json
-        payload = json.dumps(alert_data)
+        payload = json_utils.dumps(alert_data)
 
         self.logger.info(f"Publishing {severity} alert", alert_message=message)
         self.mqtt.publish(topic, payload)
@@ -0,0 +1,64 @@
+"""
+SafeNest JSON Utilities
+
+Fast JSON serialization for structured logs and MQTT payloads.
+Uses orjson when it is installed and falls back to the standard library
+json module otherwise, so orjson stays an optional dependency.
+"""
+
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    """Serialize raw MQTT payload bytes as text; reject anything else."""
+    if isinstance(obj, (bytes, bytearray)):
+        return obj.decode("utf-8", "replace")
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> str:
+    """
+    Serialize object to a compact JSON string.
+
+    Args:
+        obj: JSON-serializable object
+
+    Returns:
+        JSON string
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default).decode("utf-8")
+    return json.dumps(obj, separators=(",", ":"), default=_default)
+
+
+def dumpb(obj: Any) -> bytes:
+    """
+    Serialize object to compact UTF-8 JSON bytes (e.g. for MQTT payloads).
+
+    Args:
+        obj: JSON-serializable object
+
+    Returns:
+        JSON bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """
+    Deserialize JSON from a string or bytes.
+
+    Raises:
+        json.JSONDecodeError: If data is not valid JSON
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
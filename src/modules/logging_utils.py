@@ -5,13 +5,19 @@ Provides structured logging with JSON formatting for easy parsing and monitoring
 Supports multiple log levels and destinations for security event tracking.
 """
 
+import atexit
 import logging
-import json
+import os
+import queue
 import sys
-from datetime import datetime
+import threading
+import time
+from logging.handlers import MemoryHandler, QueueHandler, QueueListener, WatchedFileHandler
 from pathlib import Path
 from typing import Dict, Any, Optional
 
+from modules import json_utils
+
 
 class JSONFormatter(logging.Formatter):
     """
@@ -19,10 +25,26 @@ class JSONFormatter(logging.Formatter):
     Outputs logs in JSON format for easy parsing by log analysis tools.
     """
 
+    # (second, "YYYY-MM-DDTHH:MM:SS") for the most recently formatted second
+    _cached_second = (0, "")
+
+    def _timestamp(self, created: float) -> str:
+        """Return a record creation time as UTC ISO 8601 with microseconds."""
+        sec = int(created)
+
+        cached_sec, prefix = self._cached_second
+        if sec != cached_sec:
+            prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(sec))
+            self._cached_second = (sec, prefix)
+
+        return f"{prefix}.{int((created - sec) * 1_000_000):06d}Z"
+
     def format(self, record: logging.LogRecord) -> str:
         """Format log record as JSON string."""
         log_data = {
-            "timestamp": datetime.utcnow().isoformat() + "Z",
+            # record.created, not "now": records are formatted on the
+            # writer thread, possibly after a short delay
+            "timestamp": self._timestamp(record.created),
             "level": record.levelname,
             "logger": record.name,
             "message": record.getMessage(),
@@ -39,7 +61,94 @@ class JSONFormatter(logging.Formatter):
         if hasattr(record, "extra_data"):
             log_data.update(record.extra_data)
 
-        return json.dumps(log_data)
+        return json_utils.dumps(log_data)
+
+
+class _BurstBufferingHandler(MemoryHandler):
+    """
+    MemoryHandler that also flushes whenever the record queue runs dry.
+
+    Bursts are written in batches of up to `capacity` records, while a
+    lone record on a quiet system still reaches the file immediately.
+    """
+
+    def __init__(self, capacity: int, flushLevel: int, target: logging.Handler,
+                 record_queue: queue.SimpleQueue):
+        super().__init__(capacity, flushLevel=flushLevel, target=target)
+        self._record_queue = record_queue
+
+    def shouldFlush(self, record: logging.LogRecord) -> bool:
+        return super().shouldFlush(record) or self._record_queue.empty()
+
+    def flush(self):
+        """Hand the whole buffer to the target in one batch."""
+        with self.lock:
+            if self.target and self.buffer:
+                self.target.emit_batch(self.buffer)
+                self.buffer.clear()
+
+
+class _BatchFileHandler(WatchedFileHandler):
+    """
+    WatchedFileHandler that writes a batch of records at once.
+
+    The file is checked for rotation once per batch, and the formatted
+    records go out in a single write() and flush() instead of one of each
+    (plus an os.stat) per record.
+    """
+
+    def emit_batch(self, records: list):
+        with self.lock:
+            try:
+                self.reopenIfNeeded()
+                if self.stream is None:
+                    self.stream = self._open()
+                self.stream.write("".join(
+                    self.format(record) + self.terminator
+                    for record in records if self.filter(record)
+                ))
+                self.stream.flush()
+            except Exception:
+                self.handleError(records[-1])
+
+
+# One queue and background writer thread per log file, shared by all loggers
+_file_queues: Dict[str, queue.SimpleQueue] = {}
+_file_queues_lock = threading.Lock()
+
+
+def _get_file_queue(log_file: str) -> queue.SimpleQueue:
+    """
+    Return the record queue feeding the JSON file writer for log_file.
+
+    The first call for a path opens the file handler and starts a
+    QueueListener thread that owns it; later calls reuse both.
+    """
+    with _file_queues_lock:
+        record_queue = _file_queues.get(log_file)
+        if record_queue is None:
+            # WatchedFileHandler reopens the file after logrotate moves it
+            file_handler = _BatchFileHandler(log_file)
+            file_handler.setLevel(logging.DEBUG)
+            file_handler.setFormatter(JSONFormatter())
+
+            record_queue = queue.SimpleQueue()
+            buffer_handler = _BurstBufferingHandler(
+                capacity=256,
+                flushLevel=logging.ERROR,
+                target=file_handler,
+                record_queue=record_queue
+            )
+            listener = QueueListener(record_queue, buffer_handler, respect_handler_level=True)
+            listener.start()
+
+            # atexit runs last-registered first: drain the queue, then flush
+            atexit.register(buffer_handler.flush)
+            atexit.register(listener.stop)
+
+            _file_queues[log_file] = record_queue
+
+        return record_queue
 
 
 class SecurityLogger:
@@ -60,12 +169,10 @@ class SecurityLogger:
             console: Whether to log to console
         """
         self.logger = logging.getLogger(name)
-        self.logger.setLevel(logging.DEBUG)
+        # SAFENEST_LOG_LEVEL=INFO skips debug records before they are built
+        self.logger.setLevel(os.environ.get("SAFENEST_LOG_LEVEL", "DEBUG").upper())
         self.logger.handlers.clear()  # Clear any existing handlers
 
-        # JSON formatter for structured logs
-        json_formatter = JSONFormatter()
-
         # Console handler with color-coded standard format
         if console:
             console_handler = logging.StreamHandler(sys.stdout)
@@ -77,44 +184,56 @@ class SecurityLogger:
             console_handler.setFormatter(console_format)
             self.logger.addHandler(console_handler)
 
-        # File handler with JSON format
+        # File handler with JSON format (written by a background thread so
+        # callers only pay for a queue put)
         if log_file:
             log_path = Path(log_file)
             log_path.parent.mkdir(parents=True, exist_ok=True)
 
-            file_handler = logging.FileHandler(log_file)
-            file_handler.setLevel(logging.DEBUG)
-            file_handler.setFormatter(json_formatter)
-            self.logger.addHandler(file_handler)
+            queue_handler = QueueHandler(_get_file_queue(log_file))
+            queue_handler.setLevel(logging.DEBUG)
+            self.logger.addHandler(queue_handler)
+
+    def isEnabledFor(self, level: int) -> bool:
+        """Return True if a message at level would be processed."""
+        return self.logger.isEnabledFor(level)
+
+    def _log_with_extra(self, level: int, message: str, extra_data: Optional[Dict[str, Any]] = None,
+                        args: tuple = ()):
+        # Skip building the record for filtered-out levels
+        if not self.logger.isEnabledFor(level):
+            return
 
-    def _log_with_extra(self, level: int, message: str, extra_data: Optional[Dict[str, Any]] = None):
         try:
             if extra_data:
-                self.logger.log(level, message, extra={"extra_data": extra_data})
+                self.logger.log(level, message, *args, extra={"extra_data": extra_data})
             else:
-                self.logger.log(level, message)
+                self.logger.log(level, message, *args)
         except OSError:
             pass
 
-    def info(self, message: str, **kwargs):
-        """Log informational message."""
-        self._log_with_extra(logging.INFO, message, kwargs or None)
+    def info(self, message: str, *args, **kwargs):
+        """Log informational message (%-style args are formatted lazily)."""
+        if self.logger.isEnabledFor(logging.INFO):
+            self._log_with_extra(logging.INFO, message, kwargs or None, args)
 
-    def warning(self, message: str, **kwargs):
+    def warning(self, message: str, *args, **kwargs):
         """Log warning message."""
-        self._log_with_extra(logging.WARNING, message, kwargs or None)
+        if self.logger.isEnabledFor(logging.WARNING):
+            self._log_with_extra(logging.WARNING, message, kwargs or None, args)
 
-    def error(self, message: str, **kwargs):
+    def error(self, message: str, *args, **kwargs):
         """Log error message."""
-        self._log_with_extra(logging.ERROR, message, kwargs or None)
+        self._log_with_extra(logging.ERROR, message, kwargs or None, args)
 
-    def critical(self, message: str, **kwargs):
+    def critical(self, message: str, *args, **kwargs):
         """Log critical security event."""
-        self._log_with_extra(logging.CRITICAL, message, kwargs or None)
+        self._log_with_extra(logging.CRITICAL, message, kwargs or None, args)
 
-    def debug(self, message: str, **kwargs):
+    def debug(self, message: str, *args, **kwargs):
         """Log debug message."""
-        self._log_with_extra(logging.DEBUG, message, kwargs or None)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self._log_with_extra(logging.DEBUG, message, kwargs or None, args)
 
     def security_event(self, event_type: str, severity: str, details: Dict[str, Any]):
         """
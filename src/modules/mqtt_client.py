@@ -5,12 +5,56 @@ Provides a secure MQTT client wrapper with TLS support, automatic reconnection,
 and callback-based message handling for the SafeNest system.
 """
 
+import functools
+import hashlib
+import logging
+import os
 import ssl
 import time
-from typing import Callable, Optional, Dict, Any
+import random
+import threading
+from typing import Callable, Optional, Dict, Any, Tuple, Union
 import paho.mqtt.client as mqtt
+from paho.mqtt.matcher import MQTTMatcher
 from modules.logging_utils import get_logger
 
+# Bound on cached topic -> callbacks resolutions (guards against topic floods)
+MATCH_CACHE_SIZE = 1024
+
+# Shared clients keyed by broker, credentials and TLS settings,
+# see SecureMQTTClient.get_or_create
+_CLIENT_POOL: Dict[tuple, "SecureMQTTClient"] = {}
+_CLIENT_POOL_LOCK = threading.Lock()
+
+# Per-process salt so pool keys never hold a plaintext (or plainly hashed)
+# password
+_POOL_KEY_SALT = os.urandom(16)
+
+
+def _credentials_digest(username: Optional[str], password: Optional[str]) -> Optional[str]:
+    """Salted digest identifying a username/password pair in pool keys."""
+    if username is None and password is None:
+        return None
+    digest = hashlib.sha256(_POOL_KEY_SALT)
+    digest.update(f"{username}\0{password}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _get_ssl_context(ca_cert_path: str, check_hostname: bool) -> ssl.SSLContext:
+    """
+    Build (once per CA file and hostname policy) the TLS context for clients.
+
+    Parsing the CA PEM happens here rather than in every client's tls_set.
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.maximum_version = ssl.TLSVersion.TLSv1_2
+    context.load_verify_locations(cafile=ca_cert_path)
+    context.check_hostname = check_hostname
+    context.verify_mode = ssl.CERT_REQUIRED
+    return context
+
 
 class SecureMQTTClient:
     """
@@ -28,7 +72,8 @@ class SecureMQTTClient:
         username: Optional[str] = None,
         password: Optional[str] = None,
         ca_cert_path: str = None,
-        log_file: Optional[str] = None
+        log_file: Optional[str] = None,
+        allow_insecure_hostname: bool = False
     ):
         """
         Initialize secure MQTT client.
@@ -41,6 +86,8 @@ class SecureMQTTClient:
             password: MQTT password
             ca_cert_path: Path to CA certificate for TLS
             log_file: Path to log file
+            allow_insecure_hostname: Skip TLS hostname verification (self-signed
+                demo certificates addressed by IP only)
         """
         self.client_id = client_id
         self.broker_host = broker_host
@@ -55,6 +102,8 @@ class SecureMQTTClient:
             log_file=log_file,
             console=True
         )
+        # Cached so hot-path callbacks skip building debug kwargs when off
+        self._debug_enabled = self.logger.isEnabledFor(logging.DEBUG)
 
         # Create MQTT client instance
         self.client = mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv311)
@@ -65,19 +114,7 @@ class SecureMQTTClient:
 
         # Configure TLS (only if certificate path provided)
         if ca_cert_path:
-            try:
-                self.client.tls_set(
-                    ca_certs=ca_cert_path,
-                    cert_reqs=ssl.CERT_REQUIRED,
-                    tls_version=ssl.PROTOCOL_TLSv1_2
-                )
-                # For self-signed certificates in testing/demo environments,
-                # disable hostname verification to avoid IP mismatch errors
-                self.client.tls_insecure_set(True)
-                self.logger.info("TLS configured successfully (hostname verification disabled for self-signed cert)")
-            except Exception as e:
-                self.logger.error(f"Failed to configure TLS: {e}")
-                raise
+            self._configure_tls(ca_cert_path, allow_insecure_hostname)
         else:
             self.logger.info("TLS disabled - using unencrypted connection (localhost only)")
 
@@ -88,16 +125,104 @@ class SecureMQTTClient:
         self.client.on_publish = self._on_publish
         self.client.on_subscribe = self._on_subscribe
 
-        # Subscription callbacks
-        self._message_callbacks: Dict[str, Callable] = {}
-
-        # Connection state
+        # Subscription callbacks as (callback, raw) entries: exact topics
+        # resolve with one dict probe, only filters containing + or # go
+        # through the topic trie
+        self._exact_callbacks: Dict[str, Tuple[Callable, bool]] = {}
+        self._wildcard_matcher = MQTTMatcher()
+        # Wildcard flag per subscribed filter, computed once at subscribe time
+        self._filter_has_wildcard: Dict[str, bool] = {}
+        self._wildcard_count = 0
+
+        # Resolved callbacks per concrete topic, dropped on (un)subscribe
+        self._match_cache: Dict[str, tuple] = {}
+        self._subs_version = 0
+
+        # Set when this client is registered in _CLIENT_POOL, with the
+        # number of get_or_create() holders still using it
+        self._pool_key: Optional[tuple] = None
+        self._pool_refs = 0
+
+        # Connection state (event is set by _on_connect on every CONNACK;
+        # _connect_rc tells success from refusal)
         self.connected = False
+        self._connected_event = threading.Event()
+        self._connect_rc: Optional[int] = None
+
+    def _configure_tls(self, ca_cert_path: str, allow_insecure_hostname: bool):
+        """
+        Attach the shared TLS context for ca_cert_path to the paho client.
+
+        Hostname verification stays on unless allow_insecure_hostname is set,
+        which is only meant for self-signed testing/demo certificates whose
+        subject does not match the broker IP.
+        """
+        try:
+            self.client.tls_set_context(
+                _get_ssl_context(ca_cert_path, not allow_insecure_hostname)
+            )
+            if allow_insecure_hostname:
+                self.logger.warning("TLS configured with hostname verification disabled (self-signed cert)")
+            else:
+                self.logger.info("TLS configured successfully")
+        except Exception as e:
+            self.logger.error(f"Failed to configure TLS: {e}")
+            raise
+
+    @classmethod
+    def get_or_create(
+        cls,
+        client_id: str,
+        broker_host: str = "192.168.1.10",
+        broker_port: int = 1883,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        ca_cert_path: str = None,
+        log_file: Optional[str] = None,
+        allow_insecure_hostname: bool = False
+    ) -> "SecureMQTTClient":
+        """
+        Return the shared client for this broker and credentials, creating it
+        on first use.
+
+        Components in one process that talk to the same broker with the same
+        credentials share one TCP/TLS connection and network thread instead
+        of each opening their own. client_id and log_file only apply when the
+        client is first created. Each call takes a reference; disconnect()
+        releases it and only the last holder's call closes the connection.
+
+        Args:
+            Same as __init__
+
+        Returns:
+            SecureMQTTClient instance (connect() it if not already connected)
+        """
+        key = (broker_host, broker_port, _credentials_digest(username, password),
+               ca_cert_path, allow_insecure_hostname)
+        with _CLIENT_POOL_LOCK:
+            client = _CLIENT_POOL.get(key)
+            if client is None:
+                client = cls(
+                    client_id=client_id,
+                    broker_host=broker_host,
+                    broker_port=broker_port,
+                    username=username,
+                    password=password,
+                    ca_cert_path=ca_cert_path,
+                    log_file=log_file,
+                    allow_insecure_hostname=allow_insecure_hostname
+                )
+                client._pool_key = key
+                _CLIENT_POOL[key] = client
+            client._pool_refs += 1
+            return client
 
     def _on_connect(self, client, userdata, flags, rc):
         """Callback when client connects to broker."""
+        self._connect_rc = rc
         if rc == 0:
             self.connected = True
+            self._connected_event.set()
             self.logger.info(
                 "Connected to MQTT broker",
                 broker=self.broker_host,
@@ -105,6 +230,8 @@ class SecureMQTTClient:
             )
         else:
             self.connected = False
+            # Wake connect() so a refused CONNACK fails fast too
+            self._connected_event.set()
             error_messages = {
                 1: "Incorrect protocol version",
                 2: "Invalid client identifier",
@@ -118,6 +245,7 @@ class SecureMQTTClient:
     def _on_disconnect(self, client, userdata, rc):
         """Callback when client disconnects from broker."""
         self.connected = False
+        self._connected_event.clear()
         if rc == 0:
             self.logger.info("Disconnected from MQTT broker (clean)")
         else:
@@ -129,47 +257,100 @@ class SecureMQTTClient:
     def _on_message(self, client, userdata, msg):
         """Callback when message is received."""
         topic = msg.topic
-        payload = msg.payload.decode('utf-8', errors='ignore')
-
-        self.logger.debug(
-            "Message received",
-            topic=topic,
-            payload=payload,
-            qos=msg.qos
-        )
+        payload = msg.payload
+
+        if self._debug_enabled:
+            self.logger.debug(
+                "Message received",
+                topic=topic,
+                payload=payload.decode('utf-8', errors='ignore'),
+                qos=msg.qos
+            )
 
-        # Call registered callback for this topic if exists
-        for topic_pattern, callback in self._message_callbacks.items():
-            if mqtt.topic_matches_sub(topic_pattern, topic):
-                try:
-                    callback(topic, payload)
-                except Exception as e:
-                    self.logger.error(
-                        f"Error in message callback: {e}",
-                        topic=topic,
-                        callback=callback.__name__
-                    )
+        # Call registered callback for this topic if exists; decode at most
+        # once, and only if some callback wants text rather than raw bytes
+        callbacks = self._match_cache.get(topic)
+        if callbacks is None:
+            callbacks = self._resolve_callbacks(topic)
+        text = None
+        for callback, raw in callbacks:
+            if raw:
+                self._dispatch(callback, topic, payload)
+            else:
+                if text is None:
+                    text = payload.decode('utf-8', errors='ignore')
+                self._dispatch(callback, topic, text)
+
+    def _resolve_callbacks(self, topic: str) -> tuple:
+        """Match topic against the subscription tables and cache the result."""
+        version = self._subs_version
+        callbacks = []
+        entry = self._exact_callbacks.get(topic)
+        if entry is not None:
+            callbacks.append(entry)
+        if self._wildcard_count:
+            callbacks.extend(self._wildcard_matcher.iter_match(topic))
+        callbacks = tuple(callbacks)
+
+        # Skip caching if subscriptions changed while we were matching
+        if version == self._subs_version:
+            if len(self._match_cache) >= MATCH_CACHE_SIZE:
+                # Evict the oldest entry (dicts keep insertion order)
+                self._match_cache.pop(next(iter(self._match_cache)), None)
+            self._match_cache[topic] = callbacks
+        return callbacks
+
+    def _dispatch(self, callback: Callable, topic: str, payload: Union[str, bytes]):
+        """Invoke a message callback, logging instead of raising on error."""
+        try:
+            callback(topic, payload)
+        except Exception as e:
+            self.logger.error(
+                f"Error in message callback: {e}",
+                topic=topic,
+                callback=getattr(callback, "__name__", repr(callback))
+            )
 
     def _on_publish(self, client, userdata, mid):
         """Callback when message is published."""
-        self.logger.debug("Message published", message_id=mid)
+        if self._debug_enabled:
+            self.logger.debug("Message published", message_id=mid)
 
     def _on_subscribe(self, client, userdata, mid, granted_qos):
         """Callback when subscription is confirmed."""
-        self.logger.debug("Subscription confirmed", message_id=mid, qos=granted_qos)
+        if self._debug_enabled:
+            self.logger.debug("Subscription confirmed", message_id=mid, qos=granted_qos)
 
-    def connect(self, retry: bool = True, retry_interval: int = 5, max_retries: int = 10):
+    def connect(
+        self,
+        retry: bool = True,
+        retry_interval: Optional[float] = None,
+        max_retries: int = 10,
+        backoff_min: float = 1.0,
+        backoff_max: float = 60.0,
+        jitter_divisor: float = 4
+    ):
         """
         Connect to MQTT broker with optional retry logic.
 
+        Retries back off exponentially from backoff_min up to backoff_max,
+        minus a random jitter of up to 1/jitter_divisor of the delay, so a
+        fleet of clients does not reconnect in lockstep after an outage.
+
         Args:
             retry: Whether to retry on connection failure
-            retry_interval: Seconds between retry attempts
+            retry_interval: Initial retry delay in seconds (overrides backoff_min)
             max_retries: Maximum number of retry attempts (-1 for infinite)
+            backoff_min: Initial retry delay in seconds
+            backoff_max: Maximum retry delay in seconds
+            jitter_divisor: Jitter is up to delay / jitter_divisor
 
         Returns:
             bool: True if connected successfully
         """
+        if retry_interval is not None:
+            backoff_min = retry_interval
+
         attempts = 0
         while True:
             try:
@@ -178,19 +359,20 @@ class SecureMQTTClient:
                     broker=self.broker_host,
                     port=self.broker_port
                 )
+                self._connected_event.clear()
+                self._connect_rc = None
                 self.client.connect(self.broker_host, self.broker_port, keepalive=60)
                 self.client.loop_start()
 
-                # Wait for connection to establish
-                timeout = 10
-                while not self.connected and timeout > 0:
-                    time.sleep(0.5)
-                    timeout -= 0.5
-
-                if self.connected:
-                    return True
-                else:
+                # Wait for CONNACK (woken by _on_connect, no polling)
+                if not self._connected_event.wait(timeout=10):
                     raise ConnectionError("Connection timeout")
+                if self._connect_rc:
+                    # Refused: stop the network loop so it doesn't keep
+                    # reconnecting with the rejected credentials
+                    self.client.loop_stop()
+                    raise ConnectionError(f"Connection refused (rc={self._connect_rc})")
+                return True
 
             except Exception as e:
                 attempts += 1
@@ -203,22 +385,40 @@ class SecureMQTTClient:
                     self.logger.critical("Max connection retries reached")
                     return False
 
-                self.logger.info(f"Retrying in {retry_interval} seconds...")
-                time.sleep(retry_interval)
+                # Cap the exponent: with max_retries=-1 attempts grows without
+                # bound and 2 ** attempts would overflow the float multiply
+                delay = min(backoff_max, backoff_min * 2 ** min(attempts - 1, 16))
+                delay -= random.random() * (delay / jitter_divisor)
+                self.logger.info(f"Retrying in {delay:.1f} seconds...")
+                time.sleep(delay)
 
     def disconnect(self):
-        """Disconnect from MQTT broker."""
+        """
+        Disconnect from MQTT broker.
+
+        For a shared client from get_or_create() this releases the caller's
+        reference; the connection stays up until the last holder disconnects.
+        """
+        if self._pool_key is not None:
+            with _CLIENT_POOL_LOCK:
+                self._pool_refs -= 1
+                if self._pool_refs > 0:
+                    self.logger.info("Released shared MQTT client", holders=self._pool_refs)
+                    return
+                if _CLIENT_POOL.get(self._pool_key) is self:
+                    del _CLIENT_POOL[self._pool_key]
+                self._pool_key = None
         self.logger.info("Disconnecting from MQTT broker")
         self.client.loop_stop()
         self.client.disconnect()
 
-    def publish(self, topic: str, payload: str, qos: int = 1, retain: bool = False):
+    def publish(self, topic: str, payload: Union[str, bytes], qos: int = 1, retain: bool = False):
         """
         Publish message to MQTT topic.
 
         Args:
             topic: MQTT topic
-            payload: Message payload
+            payload: Message payload (str or bytes)
             qos: Quality of Service (0, 1, or 2)
             retain: Whether message should be retained
 
@@ -250,7 +450,13 @@ class SecureMQTTClient:
             self.logger.error(f"Exception during publish: {e}", topic=topic)
             return False
 
-    def subscribe(self, topic: str, callback: Callable[[str, str], None], qos: int = 1):
+    def subscribe(
+        self,
+        topic: str,
+        callback: Callable[[str, Union[str, bytes]], None],
+        qos: int = 1,
+        raw: bool = False
+    ):
         """
         Subscribe to MQTT topic with callback.
 
@@ -258,10 +464,13 @@ class SecureMQTTClient:
             topic: MQTT topic (supports wildcards + and #)
             callback: Function to call when message received (topic, payload)
             qos: Quality of Service (0, 1, or 2)
+            raw: Pass the payload as undecoded bytes instead of a str
 
         Returns:
             bool: True if subscribed successfully
         """
+        self._debug_enabled = self.logger.isEnabledFor(logging.DEBUG)
+
         if not self.connected:
             self.logger.error("Cannot subscribe: not connected to broker")
             return False
@@ -269,7 +478,15 @@ class SecureMQTTClient:
         try:
             result, mid = self.client.subscribe(topic, qos=qos)
             if result == mqtt.MQTT_ERR_SUCCESS:
-                self._message_callbacks[topic] = callback
+                has_wildcard = '+' in topic or topic.endswith('#')
+                if has_wildcard:
+                    self._wildcard_matcher[topic] = (callback, raw)
+                    if not self._filter_has_wildcard.get(topic):
+                        self._wildcard_count += 1
+                else:
+                    self._exact_callbacks[topic] = (callback, raw)
+                self._filter_has_wildcard[topic] = has_wildcard
+                self._invalidate_match_cache()
                 self.logger.info("Subscribed to topic", topic=topic, qos=qos)
                 return True
             else:
@@ -281,7 +498,17 @@ class SecureMQTTClient:
 
     def unsubscribe(self, topic: str):
         """Unsubscribe from MQTT topic."""
-        if topic in self._message_callbacks:
-            del self._message_callbacks[topic]
+        has_wildcard = self._filter_has_wildcard.pop(topic, None)
+        if has_wildcard:
+            del self._wildcard_matcher[topic]
+            self._wildcard_count -= 1
+        elif has_wildcard is not None:
+            del self._exact_callbacks[topic]
+        self._invalidate_match_cache()
         self.client.unsubscribe(topic)
         self.logger.info("Unsubscribed from topic", topic=topic)
+
+    def _invalidate_match_cache(self):
+        """Drop cached topic resolutions after the subscription set changes."""
+        self._subs_version += 1
+        self._match_cache.clear()
@@ -12,17 +12,18 @@ Responsibilities:
 - Expose clean log messages for demo
 """
 
-import json
 import logging
 import signal
 import sys
 import threading
 import time
-from typing import Dict
+from collections import deque
+from typing import Callable, Dict, Optional
 
 from modules.mqtt_client import SecureMQTTClient
 from modules.device_controller import DeviceController
 from modules.logging_utils import get_logger
+from modules import json_utils
 
 
 # -----------------------------------------------------------------------------
@@ -40,10 +41,20 @@ TOPIC_LIGHT2_STATE = "safenest/light2/state"
 TOPIC_INTERCOM_EVENT = "safenest/intercom/event"
 TOPIC_COMMANDS = "safenest/system/command"
 TOPIC_ALERTS = "safenest/alerts/info"
+TOPIC_ALERTS_BATCH = "safenest/alerts/batch"
 TOPIC_STATUS = "safenest/system/status"
 
 LOG_COMPONENT = "safenest_controller"
 
+# Alerts raised within this window are coalesced into one publish
+ALERT_BATCH_INTERVAL = 0.02  # Seconds
+
+# Constant leading fields of the alert/status payloads, encoded once; only
+# the message/status and timestamp (integer Unix epoch milliseconds) are
+# serialized per publish
+_ALERT_PREFIX = b'{"severity":"info","source":' + json_utils.dumpb(LOG_COMPONENT) + b',"message":'
+_STATUS_PREFIX = b'{"component":' + json_utils.dumpb(LOG_COMPONENT) + b',"status":'
+
 
 # -----------------------------------------------------------------------------
 # Controller
@@ -59,11 +70,13 @@ class SafeNestController:
 
         self.logger.info("Initializing SafeNest Controller...")
 
-        # Track simple device states in memory (string states)
-        self.devices: Dict[str, str] = {}
+        # Track simple device states in memory (raw MQTT payload bytes;
+        # the JSON log formatter decodes them if they are ever logged)
+        self.devices: Dict[str, bytes] = {}
 
-        # MQTT client for controller
-        self.mqtt_client = SecureMQTTClient(
+        # MQTT client for controller (shared with any other in-process
+        # component using the same broker and credentials)
+        self.mqtt_client = SecureMQTTClient.get_or_create(
             client_id="safenest_controller",
             broker_host=MQTT_HOST,
             broker_port=MQTT_PORT,
@@ -76,7 +89,15 @@ class SafeNestController:
         self.device_controller = DeviceController(mqtt_client=self.mqtt_client)
 
         self._running = False
-        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+        # Pending alert payloads, drained by _alert_flush_loop
+        self._pending_alerts: deque = deque()
+        self._pending_lock = threading.Lock()
+        self._alert_event = threading.Event()
+
+        # Per-message state logs are debug-level; skip building them when off
+        self._debug_enabled = self.logger.isEnabledFor(logging.DEBUG)
 
     # ------------------------------------------------------------------
     # MQTT subscription setup
@@ -87,22 +108,27 @@ class SafeNestController:
         self.mqtt_client.subscribe(
             topic=TOPIC_MOTION_STATE,
             qos=1,
-            callback=self._on_motion_state,
+            # Security logic (motion while armed -> alert) would hook in as extra
+            callback=self._make_state_cb("motion_sensor"),
+            raw=True,
         )
         self.mqtt_client.subscribe(
             topic=TOPIC_LIGHT1_STATE,
             qos=1,
-            callback=self._on_light1_state,
+            callback=self._make_state_cb("light1"),
+            raw=True,
         )
         self.mqtt_client.subscribe(
             topic=TOPIC_LIGHT2_STATE,
             qos=1,
-            callback=self._on_light2_state,
+            callback=self._make_state_cb("light2"),
+            raw=True,
         )
         self.mqtt_client.subscribe(
             topic=TOPIC_INTERCOM_EVENT,
             qos=1,
-            callback=self._on_intercom_event,
+            callback=self._make_state_cb("intercom", extra=self._on_intercom_event),
+            raw=True,
         )
 
     def _subscribe_to_commands(self) -> None:
@@ -111,51 +137,89 @@ class SafeNestController:
             topic=TOPIC_COMMANDS,
             qos=1,
             callback=self._on_system_command,
+            raw=True,
         )
 
     # ------------------------------------------------------------------
     # Helper methods
     # ------------------------------------------------------------------
 
-    def _update_device_state(
+    def _make_state_cb(
         self,
         device_id: str,
-        new_state: str,
-    ) -> None:
-        with self._lock:
-            self.devices[device_id] = new_state
-
-        self.logger.debug(
-            "Updated state",
-            device_id=device_id,
-            new_state=new_state,
-        )
+        extra: Optional[Callable[[bytes], None]] = None,
+    ) -> Callable[[str, bytes], None]:
+        """
+        Build the subscription callback that records a device's state.
+
+        device_id (and an optional extra hook run after the update) are bound
+        into a closure at subscribe time instead of one method per device.
+        """
+        devices = self.devices
+        logger = self.logger if self._debug_enabled else None
+
+        def cb(topic: str, payload: bytes) -> None:
+            # Single-key dict store: atomic under the GIL, and all callbacks
+            # run on paho's one network thread, so no lock is needed
+            devices[device_id] = payload
+            if logger is not None:
+                logger.debug("Updated state: %s = %r", device_id, payload)
+            if extra is not None:
+                extra(payload)
+
+        cb.__name__ = f"on_{device_id}_state"
+        return cb
 
     def _publish_info_alert(self, message: str) -> None:
         """Publish a simple info alert as JSON-safe payload."""
-        payload = json.dumps(
-            {
-                "severity": "info",
-                "source": LOG_COMPONENT,
-                "message": message,
-                "timestamp": time.time(),
-            }
+        payload = (
+            _ALERT_PREFIX + json_utils.dumpb(message)
+            + b',"timestamp":' + str(time.time_ns() // 1_000_000).encode() + b'}'
         )
+        self._pending_alerts.append(payload)
+        self._alert_event.set()
+        self.logger.info("Publishing info alert: %s", message)
+
+    def _alert_flush_loop(self) -> None:
+        """Background thread: coalesce alert bursts into a single publish."""
+        while True:
+            self._alert_event.wait()
+            # Let the rest of a burst arrive before draining
+            time.sleep(ALERT_BATCH_INTERVAL)
+            self._alert_event.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Publish all pending alerts.
+
+        A lone alert goes to safenest/alerts/info as before; two or more are
+        sent as one JSON array on safenest/alerts/batch (see README,
+        Monitoring).
+        """
+        # stop() and the flusher thread may drain concurrently
+        with self._pending_lock:
+            # popleft() rather than clear() so concurrent appends aren't lost
+            batch = [self._pending_alerts.popleft() for _ in range(len(self._pending_alerts))]
+        if not batch:
+            return
+
+        if len(batch) == 1:
+            topic, payload = TOPIC_ALERTS, batch[0]
+        else:
+            topic, payload = TOPIC_ALERTS_BATCH, b"[" + b",".join(batch) + b"]"
+
         self.mqtt_client.publish(
-            topic=TOPIC_ALERTS,
+            topic=topic,
             payload=payload,
             qos=1,
             retain=False,
         )
-        self.logger.info("Publishing info alert", alert_message=message)
 
     def _publish_status(self, status: str) -> None:
-        payload = json.dumps(
-            {
-                "component": LOG_COMPONENT,
-                "status": status,
-                "timestamp": time.time(),
-            }
+        payload = (
+            _STATUS_PREFIX + json_utils.dumpb(status)
+            + b',"timestamp":' + str(time.time_ns() // 1_000_000).encode() + b'}'
         )
         self.mqtt_client.publish(
             topic=TOPIC_STATUS,
@@ -168,45 +232,19 @@ class SafeNestController:
     # MQTT callbacks
     # ------------------------------------------------------------------
 
-    def _on_motion_state(self, topic: str, payload: str) -> None:
-        self.logger.info("Motion topic update", payload=payload)
-        self._update_device_state(
-            device_id="motion_sensor",
-            new_state=payload,
-        )
+    def _on_intercom_event(self, payload: bytes) -> None:
+        """Intercom extra hook: alert when the doorbell rings."""
+        self.logger.info("Intercom event: %r", payload)
 
-        # Example security logic: motion while system armed -> alert
-        # (For now, system is always "disarmed" in demo; logic can be extended.)
-
-    def _on_light1_state(self, topic: str, payload: str) -> None:
-        self.logger.info("Light1 state update", payload=payload)
-        self._update_device_state(
-            device_id="light1",
-            new_state=payload,
-        )
-
-    def _on_light2_state(self, topic: str, payload: str) -> None:
-        self.logger.info("Light2 state update", payload=payload)
-        self._update_device_state(
-            device_id="light2",
-            new_state=payload,
-        )
-
-    def _on_intercom_event(self, topic: str, payload: str) -> None:
-        self.logger.info("Intercom event", payload=payload)
-        self._update_device_state(
-            device_id="intercom",
-            new_state=payload,
-        )
-
-        if payload == "ringing":
+        if payload == b"ringing":
             self._publish_info_alert("Intercom: doorbell pressed (demo event)")
 
-    def _on_system_command(self, topic: str, payload: str) -> None:
-        self.logger.info("System command received", payload=payload)
+    def _on_system_command(self, topic: str, payload: bytes) -> None:
+        command = payload.decode("utf-8", "replace")
+        self.logger.info("System command received: %s", command)
         # In full version, handle "ARM", "DISARM", etc.
         # For demo we just log it and publish a simple alert.
-        self._publish_info_alert(f"System command received: {payload}")
+        self._publish_info_alert(f"System command received: {command}")
 
     # ------------------------------------------------------------------
     # Main loop
@@ -218,6 +256,12 @@ class SafeNestController:
         # Connect MQTT
         self.mqtt_client.connect()
 
+        threading.Thread(
+            target=self._alert_flush_loop,
+            name="alert_flush",
+            daemon=True,
+        ).start()
+
         # Subscribe to device topics and commands
         self._subscribe_to_state_topics()
         self._subscribe_to_commands()
@@ -228,8 +272,8 @@ class SafeNestController:
         self.logger.info("SafeNest Controller is now running")
 
         try:
-            while self._running:
-                time.sleep(1.0)
+            # Block until stop() signals, no periodic wakeups
+            self._stop_event.wait()
         except KeyboardInterrupt:
             self.logger.info("Keyboard interrupt received, stopping...")
         finally:
@@ -240,9 +284,11 @@ class SafeNestController:
             return
 
         self._running = False
+        self._stop_event.set()
         self.logger.info("Stopping SafeNest Controller...")
         self._publish_info_alert("SafeNest Controller shutting down")
         self._publish_status("stopped")
+        self.flush()
 
         try:
             self.mqtt_client.disconnect()
@@ -4,7 +4,7 @@
 SafeNest Anomaly Detection Engine
 
 IDS-like security monitoring service for the SafeNest smart home system.
-Monitors all MQTT traffic for suspicious patterns and potential attacks.
+Monitors SafeNest MQTT traffic for suspicious patterns and potential attacks.
 
 Detection Capabilities:
 - Rate-based DoS detection (message flooding)
@@ -22,25 +22,71 @@ Version: 1.0.0
 
 import sys
 import signal
+import threading
 import time
-import json
+import functools
+import re
+from array import array
 from pathlib import Path
-from collections import defaultdict, deque
+from collections import OrderedDict, defaultdict, deque
 from datetime import datetime, timedelta
-from typing import Dict, Deque, Set
+from typing import Dict, Deque, List, Pattern, Set, Tuple
 
 # Add modules directory to path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from modules.mqtt_client import SecureMQTTClient
+from modules import json_utils
 from modules.logging_utils import get_logger
 
 
+def _put_bounded(table: dict, key, value, max_size: int):
+    """Set table[key], first evicting the oldest entry if a new key would exceed max_size."""
+    if key not in table and len(table) >= max_size:
+        del table[next(iter(table))]
+    table[key] = value
+
+
+class TimestampRing:
+    """
+    Fixed-size ring of float timestamps stored as packed C doubles.
+
+    A drop-in for deque(maxlen=...) on append-only histories: 8 bytes per
+    slot, preallocated once, instead of one float object per entry.
+    """
+
+    __slots__ = ("_buf", "_head", "_count")
+
+    def __init__(self, capacity: int):
+        self._buf = array("d", bytes(8 * capacity))
+        self._head = 0  # Next slot to write
+        self._count = 0
+
+    def append(self, value: float):
+        """Store value, overwriting the oldest entry once full."""
+        buf = self._buf
+        buf[self._head] = value
+        self._head = (self._head + 1) % len(buf)
+        if self._count < len(buf):
+            self._count += 1
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int) -> float:
+        """Entry by age order (0 = oldest, -1 = newest)."""
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("TimestampRing index out of range")
+        return self._buf[(self._head - self._count + index) % len(self._buf)]
+
+
 class AnomalyDetector:
     """
     Intrusion Detection System for SafeNest MQTT network.
 
-    Monitors all MQTT traffic and detects:
+    Monitors all SafeNest MQTT traffic and detects:
     - DoS attacks (message flooding)
     - Unauthorized topic access
     - Suspicious patterns in sensor data
@@ -51,6 +97,20 @@ class AnomalyDetector:
     DOS_TIME_WINDOW = 5  # Seconds
     MOTION_BURST_THRESHOLD = 10  # Motion events per time window
     MOTION_BURST_WINDOW = 10  # Seconds
+    ALERT_COALESCE_WINDOW = 5  # Seconds between alerts per (event, topic)
+
+    # Only the SafeNest namespace is monitored; the broker filters out all
+    # other traffic before it reaches this process. A single filter covers
+    # every known topic plus unknown ones under safenest/ (overlapping
+    # filters would deliver the same message more than once).
+    MONITOR_TOPIC = "safenest/#"
+
+    # Cap on per-topic state, so a scan over millions of distinct topics
+    # cannot grow memory without bound
+    MAX_TRACKED_TOPICS = 10_000
+
+    # Constant head of every alert payload, serialized once
+    _ALERT_PREFIX = b'{"source":"anomaly_detector",'
 
     # === ALLOWED TOPIC MAPPINGS ===
     # Define which clients (by username) can publish to which topics
@@ -64,6 +124,22 @@ class AnomalyDetector:
         "security_user": ["safenest/alerts/#"],  # Security can publish alerts
     }
 
+    # Intern the whitelisted topics so lookups against interned message
+    # topics compare by identity
+    for _patterns in TOPIC_WHITELIST.values():
+        _patterns[:] = [sys.intern(_p) for _p in _patterns]
+    del _patterns
+
+    # Second topic level (safenest/<segment>/...) -> publishing client
+    _CLIENT_BY_SEG = {
+        "motion": "motion_user",
+        "intercom": "intercom_user",
+        "light1": "light1_user",
+        "light2": "light2_user",
+        "system": "controller_user",
+        "alerts": "controller_user",
+    }
+
     def __init__(self):
         """Initialize anomaly detection engine."""
         self.logger = get_logger(
@@ -86,21 +162,24 @@ class AnomalyDetector:
         )
 
         # === DETECTION STATE ===
-        # Track message rates per topic
-        self.topic_message_times: Dict[str, Deque[float]] = defaultdict(
-            lambda: deque(maxlen=1000)
-        )
+        # Track message rates per topic (sliding window: timestamps older than
+        # DOS_TIME_WINDOW are popped as new messages arrive). Each deque holds
+        # at most DOS_THRESHOLD + 1 entries, enough to tell that the threshold
+        # was exceeded, so a flood cannot grow it. Kept in LRU order so the
+        # least recently seen topic is evicted at the cap.
+        self.topic_message_times: "OrderedDict[str, Deque[float]]" = OrderedDict()
 
         # Track message rates per client (based on topic patterns)
-        self.client_message_times: Dict[str, Deque[float]] = defaultdict(
-            lambda: deque(maxlen=1000)
+        self.client_message_times: Dict[str, TimestampRing] = defaultdict(
+            lambda: TimestampRing(1000)
         )
 
-        # Track motion events specifically
-        self.motion_events: Deque[float] = deque(maxlen=100)
+        # Track motion events specifically (sliding MOTION_BURST_WINDOW,
+        # bounded like the per-topic deques)
+        self.motion_events: Deque[float] = deque(maxlen=self.MOTION_BURST_THRESHOLD + 1)
 
         # Track known/expected clients
-        self.known_topics: Set[str] = {
+        self.known_topics: Set[str] = {sys.intern(t) for t in (
             "safenest/motion/state",
             "safenest/intercom/event",
             "safenest/light1/state",
@@ -112,13 +191,29 @@ class AnomalyDetector:
             "safenest/alerts/critical",
             "safenest/system/command",
             "safenest/system/status",
-        }
+        )}
 
-        # Blocked topics/clients (temporary blacklist)
-        self.blocked_topics: Set[str] = set()
+        # TOPIC_WHITELIST expanded into exact/prefix/regex tables
+        self._exact_allowed, self._prefix_allowed, self._regex_allowed = \
+            self._compile_whitelist()
+
+        # Per-topic (client_id, is_allowed) decisions; the whitelist is static
+        self._auth_cache: Dict[str, Tuple[str, bool]] = {}
+
+        # (event_type, topic) -> (last alert time, alerts suppressed since)
+        self._alert_last: Dict[Tuple[str, str], Tuple[float, int]] = {}
+
+        # Blocked topics/clients (temporary blacklist); topics are dict keys
+        # in insertion order so the oldest can be evicted at the cap
+        self.blocked_topics: Dict[str, bool] = {}
         self.blocked_clients: Set[str] = set()
 
+        # Alert timestamp text, reused while the second has not changed
+        self._ts_last_sec = 0
+        self._ts_cached = ""
+
         self.running = False
+        self._stop_event = threading.Event()
 
     def start(self):
         """Start the anomaly detection service."""
@@ -129,8 +224,8 @@ class AnomalyDetector:
             self.logger.critical("Failed to connect to MQTT broker. Exiting.")
             return False
 
-        # Subscribe to ALL topics for monitoring
-        self.mqtt_client.subscribe("#", self._on_any_message)
+        # Subscribe to the monitored namespace
+        self.mqtt_client.subscribe(self.MONITOR_TOPIC, self._on_any_message)
 
         self.running = True
         self.logger.info("Anomaly Detection Engine is now running")
@@ -148,8 +243,22 @@ class AnomalyDetector:
         """
         current_time = time.time()
 
-        # Record message for rate tracking
-        self.topic_message_times[topic].append(current_time)
+        # Topics come from a small set; interned keys hash and compare by
+        # identity in every per-topic dict/set below
+        topic = sys.intern(topic)
+
+        # Record message for rate tracking and drop timestamps that left the
+        # window, so len() is the recent count
+        times = self.topic_message_times.get(topic)
+        if times is None:
+            times = deque(maxlen=self.DOS_THRESHOLD + 1)
+            _put_bounded(self.topic_message_times, topic, times, self.MAX_TRACKED_TOPICS)
+        else:
+            self.topic_message_times.move_to_end(topic)
+        times.append(current_time)
+        cutoff_time = current_time - self.DOS_TIME_WINDOW
+        while times[0] <= cutoff_time:
+            times.popleft()
 
         # Infer client from topic (simple heuristic for demo)
         client_id = self._infer_client_from_topic(topic)
@@ -159,10 +268,10 @@ class AnomalyDetector:
         # === DETECTION CHECKS ===
 
         # 1. Check for DoS (message flooding)
-        self._check_dos_attack(topic, client_id)
+        self._check_dos_attack(topic, client_id, current_time)
 
         # 2. Check for unauthorized topic usage
-        self._check_unauthorized_topic(topic, payload)
+        self._check_unauthorized_topic(topic, payload, current_time)
 
         # 3. Check for suspicious motion patterns
         if topic == "safenest/motion/state":
@@ -170,77 +279,75 @@ class AnomalyDetector:
 
         # 4. Check for unknown topics
         if topic not in self.known_topics and not topic.startswith("safenest/alerts"):
-            self._check_unknown_topic(topic)
+            self._check_unknown_topic(topic, current_time)
 
-    def _infer_client_from_topic(self, topic: str) -> str:
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def _infer_client_from_topic(topic: str) -> str:
         """
         Infer client ID from topic pattern.
 
         In production, you'd get this from MQTT broker logs or client certificates.
         For this demo, we use topic patterns.
         """
-        if "motion" in topic:
-            return "motion_user"
-        elif "intercom" in topic:
-            return "intercom_user"
-        elif "light1" in topic:
-            return "light1_user"
-        elif "light2" in topic:
-            return "light2_user"
-        elif "system" in topic or "alerts" in topic:
-            return "controller_user"
-        else:
-            return "unknown"
+        parts = topic.split("/", 2)
+        if len(parts) > 1 and parts[0] == "safenest":
+            return AnomalyDetector._CLIENT_BY_SEG.get(parts[1], "unknown")
+        return "unknown"
 
-    def _check_dos_attack(self, topic: str, client_id: str):
+    def _check_dos_attack(self, topic: str, client_id: str, current_time: float):
         """
         Detect DoS attacks based on message rate.
 
         Triggers if more than DOS_THRESHOLD messages in DOS_TIME_WINDOW seconds.
         """
-        current_time = time.time()
-        cutoff_time = current_time - self.DOS_TIME_WINDOW
-
-        # Count recent messages for this topic
-        topic_recent_messages = [
-            t for t in self.topic_message_times[topic]
-            if t > cutoff_time
-        ]
+        # Window already trimmed in _on_any_message. The deque is capped at
+        # DOS_THRESHOLD + 1, so this is a lower bound on the real count and
+        # is reported as min_message_count
+        message_count = len(self.topic_message_times[topic])
 
-        if len(topic_recent_messages) > self.DOS_THRESHOLD:
+        if message_count > self.DOS_THRESHOLD:
             self.logger.security_event(
                 "DOS_ATTACK_DETECTED",
                 "CRITICAL",
                 {
                     "topic": topic,
-                    "message_count": len(topic_recent_messages),
+                    "min_message_count": message_count,
                     "time_window": self.DOS_TIME_WINDOW,
                     "threshold": self.DOS_THRESHOLD,
                     "suspected_client": client_id
                 }
             )
 
-            self._publish_alert(
+            self._maybe_publish(
+                ("DOS_ATTACK", topic),
                 "critical",
                 f"DoS attack detected on topic: {topic}",
                 {
                     "topic": topic,
-                    "message_count": len(topic_recent_messages),
+                    "min_message_count": message_count,
                     "client": client_id
-                }
+                },
+                current_time
             )
 
             # Add to blocked topics temporarily
-            self.blocked_topics.add(topic)
+            _put_bounded(self.blocked_topics, topic, True, self.MAX_TRACKED_TOPICS)
 
-    def _check_unauthorized_topic(self, topic: str, payload: str):
+    def _check_unauthorized_topic(self, topic: str, payload: str, current_time: float):
         """
         Check if message is published to an unauthorized topic.
 
-        Uses TOPIC_WHITELIST to validate access.
+        Uses TOPIC_WHITELIST to validate access. The decision only depends on
+        the topic, so it is computed once per topic and cached.
         """
-        # Infer client from topic
-        client_id = self._infer_client_from_topic(topic)
+        cached = self._auth_cache.get(topic)
+        if cached is None:
+            client_id = self._infer_client_from_topic(topic)
+            is_allowed = client_id != "unknown" and self._is_allowed(client_id, topic)
+            cached = (client_id, is_allowed)
+            _put_bounded(self._auth_cache, topic, cached, self.MAX_TRACKED_TOPICS)
+        client_id, is_allowed = cached
 
         if client_id == "unknown":
             # Unknown client publishing
@@ -253,66 +360,83 @@ class AnomalyDetector:
                 }
             )
 
-            self._publish_alert(
+            self._maybe_publish(
+                ("UNAUTHORIZED_CLIENT", topic),
                 "warn",
                 f"Unknown client publishing to: {topic}",
-                {"topic": topic}
+                {"topic": topic},
+                current_time
             )
 
-        else:
-            # Check if client is allowed to publish to this topic
-            allowed_topics = self.TOPIC_WHITELIST.get(client_id, [])
-
-            # Check if topic matches any allowed pattern
-            is_allowed = False
-            for allowed_pattern in allowed_topics:
-                if self._topic_matches(topic, allowed_pattern):
-                    is_allowed = True
-                    break
-
-            if not is_allowed:
-                self.logger.security_event(
-                    "UNAUTHORIZED_TOPIC_ACCESS",
-                    "WARN",
-                    {
-                        "client": client_id,
-                        "topic": topic,
-                        "allowed_topics": allowed_topics
-                    }
-                )
-
-                self._publish_alert(
-                    "warn",
-                    f"Client {client_id} accessing unauthorized topic: {topic}",
-                    {
-                        "client": client_id,
-                        "topic": topic
-                    }
-                )
-
-    def _topic_matches(self, topic: str, pattern: str) -> bool:
-        """Check if topic matches pattern (supporting MQTT wildcards)."""
-        if pattern == "#":
-            return True
-
-        if "#" in pattern:
-            prefix = pattern.replace("/#", "")
-            return topic.startswith(prefix)
+        elif not is_allowed:
+            self.logger.security_event(
+                "UNAUTHORIZED_TOPIC_ACCESS",
+                "WARN",
+                {
+                    "client": client_id,
+                    "topic": topic,
+                    "allowed_topics": self.TOPIC_WHITELIST.get(client_id, [])
+                }
+            )
 
-        if "+" in pattern:
-            # Simple single-level wildcard matching
-            pattern_parts = pattern.split("/")
-            topic_parts = topic.split("/")
+            self._maybe_publish(
+                ("UNAUTHORIZED_TOPIC_ACCESS", topic),
+                "warn",
+                f"Client {client_id} accessing unauthorized topic: {topic}",
+                {
+                    "client": client_id,
+                    "topic": topic
+                },
+                current_time
+            )
 
-            if len(pattern_parts) != len(topic_parts):
-                return False
+    @classmethod
+    def _compile_whitelist(cls) -> Tuple[Dict[str, Set[str]], List[Tuple[str, str]],
+                                         List[Tuple[str, Pattern]]]:
+        """
+        Expand TOPIC_WHITELIST so matching needs no per-level Python code.
 
-            for p, t in zip(pattern_parts, topic_parts):
-                if p != "+" and p != t:
-                    return False
+        Returns:
+            (client_id -> exact topics, (client_id, prefix) pairs for trailing
+            '#' filters, (client_id, compiled regex) pairs for '+' filters)
+        """
+        exact_allowed: Dict[str, Set[str]] = defaultdict(set)
+        prefix_allowed: List[Tuple[str, str]] = []
+        regex_allowed: List[Tuple[str, Pattern]] = []
+
+        for client_id, patterns in cls.TOPIC_WHITELIST.items():
+            for pattern in patterns:
+                if "+" in pattern:
+                    levels = pattern.split("/")
+                    regex = "/".join(
+                        "[^/]*" if level == "+" else re.escape(level)
+                        for level in (levels[:-1] if levels[-1] == "#" else levels)
+                    )
+                    if levels[-1] == "#":
+                        regex += "(?:/.*)?"
+                    regex_allowed.append((client_id, re.compile(regex + r"\Z")))
+                elif pattern == "#":
+                    prefix_allowed.append((client_id, ""))
+                elif pattern.endswith("/#"):
+                    # "a/#" matches "a" itself and everything below "a/"
+                    exact_allowed[client_id].add(pattern[:-2])
+                    prefix_allowed.append((client_id, pattern[:-1]))
+                else:
+                    exact_allowed[client_id].add(pattern)
+
+        return dict(exact_allowed), prefix_allowed, regex_allowed
+
+    def _is_allowed(self, client_id: str, topic: str) -> bool:
+        """Check topic against client_id's whitelist (MQTT wildcard semantics)."""
+        if topic in self._exact_allowed.get(client_id, ()):
             return True
-
-        return topic == pattern
+        for allowed_client, prefix in self._prefix_allowed:
+            if allowed_client == client_id and topic.startswith(prefix):
+                return True
+        for allowed_client, regex in self._regex_allowed:
+            if allowed_client == client_id and regex.match(topic):
+                return True
+        return False
 
     def _check_motion_anomaly(self, payload: str, current_time: float):
         """
@@ -321,18 +445,21 @@ class AnomalyDetector:
         Triggers if motion events are too frequent (possible sensor malfunction or attack).
         """
         if payload == "motion_detected":
-            self.motion_events.append(current_time)
+            motion_events = self.motion_events
+            motion_events.append(current_time)
 
-            # Check for burst of motion events
+            # Check for burst of motion events (drop events outside window)
             cutoff_time = current_time - self.MOTION_BURST_WINDOW
-            recent_motion = [t for t in self.motion_events if t > cutoff_time]
+            while motion_events[0] <= cutoff_time:
+                motion_events.popleft()
+            event_count = len(motion_events)
 
-            if len(recent_motion) > self.MOTION_BURST_THRESHOLD:
+            if event_count > self.MOTION_BURST_THRESHOLD:
                 self.logger.security_event(
                     "MOTION_SENSOR_ANOMALY",
                     "WARN",
                     {
-                        "event_count": len(recent_motion),
+                        "event_count": event_count,
                         "time_window": self.MOTION_BURST_WINDOW,
                         "threshold": self.MOTION_BURST_THRESHOLD
                     }
@@ -342,12 +469,13 @@ class AnomalyDetector:
                     "warn",
                     "Suspicious motion sensor activity detected",
                     {
-                        "event_count": len(recent_motion),
+                        "event_count": event_count,
                         "possible_cause": "sensor malfunction or tampering"
-                    }
+                    },
+                    current_time=current_time
                 )
 
-    def _check_unknown_topic(self, topic: str):
+    def _check_unknown_topic(self, topic: str, current_time: float):
         """Detect messages on unknown/unexpected topics."""
         # Only alert once per unknown topic
         if topic not in self.blocked_topics:
@@ -357,47 +485,79 @@ class AnomalyDetector:
                 {"topic": topic}
             )
 
-            self._publish_alert(
+            self._maybe_publish(
+                ("UNKNOWN_TOPIC", topic),
                 "warn",
                 f"Message on unknown topic: {topic}",
-                {"topic": topic}
+                {"topic": topic},
+                current_time
             )
 
             # Mark as seen to avoid repeated alerts
-            self.blocked_topics.add(topic)
+            _put_bounded(self.blocked_topics, topic, True, self.MAX_TRACKED_TOPICS)
 
-    def _publish_alert(self, severity: str, message: str, details: dict = None):
-        """Publish security alert to MQTT."""
+    def _maybe_publish(self, event_key: Tuple[str, str], severity: str, message: str,
+                       details: dict, current_time: float):
+        """
+        Publish an alert at most once per ALERT_COALESCE_WINDOW per event_key.
+
+        Alerts inside the window are only counted; the next one that goes out
+        carries that count as suppressed_since_last, so a flood produces a
+        trickle of alerts instead of one publish per message.
+        """
+        last = self._alert_last.get(event_key)
+        if last is not None and current_time - last[0] < self.ALERT_COALESCE_WINDOW:
+            self._alert_last[event_key] = (last[0], last[1] + 1)
+            return
+
+        details["suppressed_since_last"] = last[1] if last is not None else 0
+        _put_bounded(self._alert_last, event_key, (current_time, 0), self.MAX_TRACKED_TOPICS)
+        self._publish_alert(severity, message, details, current_time=current_time)
+
+    def _alert_timestamp(self, current_time: float) -> str:
+        """Format current_time as ISO 8601 UTC (whole seconds), cached per second."""
+        sec = int(current_time)
+        if sec != self._ts_last_sec:
+            self._ts_cached = datetime.utcfromtimestamp(sec).strftime("%Y-%m-%dT%H:%M:%SZ")
+            self._ts_last_sec = sec
+        return self._ts_cached
+
+    def _publish_alert(self, severity: str, message: str, details: dict = None,
+                       current_time: float = None):
+        """
+        Publish security alert to MQTT.
+
+        current_time is the triggering message's time.time() value, reused so
+        the hot path does not read the clock again (now if omitted).
+        """
         topic = f"safenest/alerts/{severity}"
 
+        if current_time is None:
+            current_time = time.time()
+
         alert_data = {
-            "timestamp": datetime.utcnow().isoformat() + "Z",
-            "source": "anomaly_detector",
+            "timestamp": self._alert_timestamp(current_time),
             "message": message
         }
 
         if details:
             alert_data.update(details)
 
-        payload = json.dumps(alert_data)
+        # Splice the per-alert fields in after the pre-serialized prefix
+        payload = self._ALERT_PREFIX + json_utils.dumpb(alert_data)[1:]
         self.mqtt_client.publish(topic, payload)
 
     def run(self):
         """Main run loop."""
         try:
-            self.logger.info("Anomaly detector monitoring all MQTT traffic...")
+            self.logger.info(f"Anomaly detector monitoring {self.MONITOR_TOPIC} traffic...")
 
-            # Periodic cleanup of old data
-            last_cleanup = time.time()
+            # Messages are handled on the MQTT network thread; this thread only
+            # wakes for the periodic cleanup or when stop() sets the event
             cleanup_interval = 60  # Clean up every minute
 
-            while self.running:
-                # Clean up old message timestamps
-                if time.time() - last_cleanup >= cleanup_interval:
-                    self._cleanup_old_data()
-                    last_cleanup = time.time()
-
-                time.sleep(1)
+            while not self._stop_event.wait(cleanup_interval):
+                self._cleanup_old_data()
 
         except KeyboardInterrupt:
             self.logger.info("Keyboard interrupt received")
@@ -414,10 +574,15 @@ class AnomalyDetector:
         # Clean topic message times
         for topic in list(self.topic_message_times.keys()):
             times = self.topic_message_times[topic]
-            # Deque automatically maintains maxlen, but we can clear if empty
+            # Deque maxlen bounds each topic; drop topics that went quiet
             if times and times[-1] < cutoff_time:
                 del self.topic_message_times[topic]
 
+        # Forget coalescing state for events that have gone quiet
+        alert_cutoff = current_time - self.ALERT_COALESCE_WINDOW
+        for key in [k for k, (last, _) in list(self._alert_last.items()) if last < alert_cutoff]:
+            del self._alert_last[key]
+
         # Clean client message times
         for client in list(self.client_message_times.keys()):
             times = self.client_message_times[client]
@@ -428,6 +593,7 @@ class AnomalyDetector:
         """Stop the anomaly detection service."""
         self.logger.info("Stopping Anomaly Detection Engine...")
         self.running = False
+        self._stop_event.set()
 
         # Publish shutdown alert
         self._publish_alert("info", "Anomaly Detection Engine shutting down")
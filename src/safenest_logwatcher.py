@@ -4,7 +4,8 @@
 SafeNest Log Watcher and Auto-Blocker
 
 Host-based IDS that monitors log files for security events and automatically
-blocks malicious IP addresses using iptables (fail2ban-style behavior).
+blocks malicious IP addresses using an ipset matched by a single iptables
+rule (fail2ban-style behavior).
 
 Monitors:
 - /var/log/mosquitto/mosquitto.log (MQTT broker logs)
@@ -13,34 +14,42 @@ Monitors:
 Actions:
 - Parse logs for authentication failures, connection floods, repeated alerts
 - Extract source IP addresses from suspicious activity
-- Automatically block IPs using iptables after threshold exceeded
+- Automatically block IPs (ipset add) after threshold exceeded
 - Publish critical alerts to MQTT
-- Maintain block list with automatic unblocking after timeout
+- Automatic unblocking after timeout (ipset entry timeout, kernel-side)
 
 Usage:
     sudo python3 safenest_logwatcher.py
 
-Note: Requires root/sudo privileges for iptables commands
+Note: Requires root/sudo privileges and the ipset tool
 
 Author: SafeNest Security Team
 Version: 1.0.0
 """
 
+import os
 import sys
+import ctypes
+import ctypes.util
+import select
+import socket
 import signal
+import struct
 import time
 import re
-import json
+import queue
 import subprocess
+import threading
 from pathlib import Path
 from collections import defaultdict, deque
 from datetime import datetime, timedelta
-from typing import Dict, Set, Optional
+from typing import BinaryIO, Dict, Iterable, Iterator, Set, Optional, Tuple
 
 # Add modules directory to path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from modules.logging_utils import get_logger
+from modules import json_utils
 
 
 class LogWatcher:
@@ -64,26 +73,50 @@ class LogWatcher:
     # Block duration
     BLOCK_DURATION = 3600  # 1 hour in seconds
 
-    # Regex patterns to extract IPs and detect events
-    IP_PATTERN = re.compile(r'\b(?:\d{1,3}\.){3}\d{1,3}\b')
-
-    AUTH_FAILURE_PATTERNS = [
-        re.compile(r'authentication failed', re.IGNORECASE),
-        re.compile(r'bad username or password', re.IGNORECASE),
-        re.compile(r'not authorized', re.IGNORECASE),
-        re.compile(r'connection refused', re.IGNORECASE),
-    ]
-
-    DOS_PATTERNS = [
-        re.compile(r'DOS_ATTACK_DETECTED', re.IGNORECASE),
-        re.compile(r'message flooding', re.IGNORECASE),
-        re.compile(r'rate limit exceeded', re.IGNORECASE),
-    ]
-
-    UNAUTHORIZED_PATTERNS = [
-        re.compile(r'UNAUTHORIZED_', re.IGNORECASE),
-        re.compile(r'ACL denied', re.IGNORECASE),
-    ]
+    # Fallback poll interval when inotify is unavailable; with inotify this
+    # is only a safety-net timeout
+    CHECK_INTERVAL = 2
+    INOTIFY_TIMEOUT = 60
+
+    # Lines read but not yet classified; the reader blocks when it is full
+    LINE_QUEUE_SIZE = 10_000
+
+    # inotify(7) event mask: appends, plus files (re)created by log rotation
+    _IN_MODIFY = 0x00000002
+    _IN_MOVED_TO = 0x00000080
+    _IN_CREATE = 0x00000100
+    _IN_NONBLOCK = 0o4000
+    _IN_CLOEXEC = 0o2000000
+
+    # struct inotify_event header (wd, mask, cookie, len), then len name bytes
+    _INOTIFY_EVENT = struct.Struct("iIII")
+
+    # Kernel ipset holding blocked IPs; one iptables rule drops its members
+    BLOCK_SET = "safenest_block"
+
+    # Regex patterns to extract IPs and detect events. Lines stay bytes
+    # (files are read in binary mode), so there is no per-line decode.
+    IP_PATTERN = re.compile(br'\b(?:\d{1,3}\.){3}\d{1,3}\b')
+
+    # Event keywords in priority order: a line matching several types is
+    # classified as the first (auth failures feed the lowest threshold)
+    EVENT_PATTERNS = (
+        ("AUTH_FAILURE", re.compile(
+            br'authentication failed|bad username or password'
+            br'|not authorized|connection refused', re.IGNORECASE)),
+        ("DOS_ATTACK", re.compile(
+            br'DOS_ATTACK_DETECTED|message flooding|rate limit exceeded', re.IGNORECASE)),
+        ("UNAUTHORIZED_ACCESS", re.compile(
+            br'UNAUTHORIZED_|ACL denied', re.IGNORECASE)),
+    )
+
+    # All keywords fused into one pass, so lines without any event are
+    # rejected with a single search; the named group gives the leftmost match
+    EVENT_PATTERN = re.compile(
+        b'|'.join(b'(?P<%s>%s)' % (name.encode(), pattern.pattern)
+                  for name, pattern in EVENT_PATTERNS),
+        re.IGNORECASE
+    )
 
     def __init__(self):
         """Initialize log watcher."""
@@ -95,14 +128,38 @@ class LogWatcher:
 
         self.logger.info("Initializing SafeNest Log Watcher...")
 
-        # Track events per IP
-        self.ip_events: Dict[str, deque] = defaultdict(lambda: deque(maxlen=100))
+        # Event timestamps per IP, one table per event type (only times are
+        # kept; expired entries are popped from the left when counted)
+        self.auth_times: Dict[str, deque] = defaultdict(lambda: deque(maxlen=100))
+        self.dos_times: Dict[str, deque] = defaultdict(lambda: deque(maxlen=100))
+        self.unauth_times: Dict[str, deque] = defaultdict(lambda: deque(maxlen=100))
+        self._event_times: Dict[str, Dict[str, deque]] = {
+            "AUTH_FAILURE": self.auth_times,
+            "DOS_ATTACK": self.dos_times,
+            "UNAUTHORIZED_ACCESS": self.unauth_times,
+        }
 
-        # Track blocked IPs with block time
+        # Track blocked IPs with block time (the kernel expires the ipset
+        # entry; this only suppresses re-blocking within BLOCK_DURATION)
         self.blocked_ips: Dict[str, float] = {}  # IP -> block_timestamp
 
-        # Track file positions for tailing
-        self.file_positions: Dict[str, int] = {}
+        # Open handles for tailing (kept across polls; reopened on rotation)
+        self.file_handles: Dict[str, Optional[BinaryIO]] = {}
+        self._file_inodes: Dict[str, int] = {}
+        # Trailing text of a line the writer has not finished yet
+        self._partial_lines: Dict[str, bytes] = {}
+
+        # (line, log_file) handoff from the reader (run loop) to the
+        # classifier thread; None tells the classifier to exit
+        self._lines_q: "queue.Queue[Optional[Tuple[bytes, str]]]" = queue.Queue(
+            maxsize=self.LINE_QUEUE_SIZE
+        )
+        self._classifier_thread: Optional[threading.Thread] = None
+
+        # inotify descriptor watching the log directories (None -> polling),
+        # and per watch descriptor the file names in that directory we tail
+        self._inotify_fd: Optional[int] = None
+        self._inotify_watches: Dict[int, Dict[bytes, str]] = {}
 
         # Whitelist (never block these IPs)
         self.ip_whitelist: Set[str] = {
@@ -112,65 +169,294 @@ class LogWatcher:
             "::1"
         }
 
+        # One long-lived MQTT client for alerts (optional: None if paho-mqtt
+        # is not available); connected in the background by start()
+        try:
+            from modules.mqtt_client import SecureMQTTClient
+
+            self.mqtt_client = SecureMQTTClient(
+                client_id="logwatcher_alert",
+                username=None,
+                password=None,
+                ca_cert_path=None
+            )
+        except ImportError as e:
+            self.logger.warning(f"MQTT alerts disabled: {e}")
+            self.mqtt_client = None
+
+        # Alert timestamp text, reused while the second has not changed
+        self._ts_last_sec = 0
+        self._ts_cached = ""
+
         self.running = False
 
     def start(self):
         """Start log monitoring service."""
         self.logger.info("Starting SafeNest Log Watcher...")
 
-        # Initialize file positions
+        if not self._setup_block_set():
+            return False
+
+        # Open log files
         for log_file in self.LOG_FILES:
+            self._partial_lines[log_file] = b""
             if Path(log_file).exists():
                 # Start at end of file (only watch new entries)
-                with open(log_file, 'r') as f:
-                    f.seek(0, 2)  # Seek to end
-                    self.file_positions[log_file] = f.tell()
+                self._open_log(log_file, seek_end=True)
                 self.logger.info(f"Monitoring log file: {log_file}")
             else:
+                # Read from the start once it appears
                 self.logger.warning(f"Log file not found: {log_file}")
-                self.file_positions[log_file] = 0
+                self.file_handles[log_file] = None
+
+        self._inotify_fd = self._init_inotify()
+
+        # Classify on a separate thread so file reads and regex/blocking
+        # work overlap (only this thread touches the detection state)
+        self._classifier_thread = threading.Thread(
+            target=self._classifier_loop,
+            name="log_classifier",
+            daemon=True,
+        )
+        self._classifier_thread.start()
+
+        # Connect for alerts without delaying startup if the broker is down
+        if self.mqtt_client is not None:
+            threading.Thread(
+                target=self.mqtt_client.connect,
+                kwargs={"retry": True, "max_retries": -1},
+                name="mqtt_connect",
+                daemon=True,
+            ).start()
 
         self.running = True
         self.logger.info("Log Watcher is now running")
 
         return True
 
-    def _read_new_lines(self, log_file: str) -> list:
-        """Read new lines from log file since last position."""
-        if not Path(log_file).exists():
-            return []
-
-        new_lines = []
+    def _setup_block_set(self) -> bool:
+        """
+        Create the blocklist ipset and its iptables DROP rule (idempotent).
 
+        Blocking an IP is then an O(1) set insert with a kernel-side timeout
+        instead of one iptables rule per IP that must be removed later.
+        """
         try:
-            with open(log_file, 'r') as f:
-                # Seek to last known position
-                f.seek(self.file_positions[log_file])
+            subprocess.run(
+                ["ipset", "create", self.BLOCK_SET, "hash:ip",
+                 "timeout", str(self.BLOCK_DURATION), "-exist"],
+                check=True, capture_output=True, text=True
+            )
 
-                # Read new lines
-                new_lines = f.readlines()
+            rule = ["INPUT", "-m", "set", "--match-set", self.BLOCK_SET, "src", "-j", "DROP"]
+            if subprocess.run(["iptables", "-C", *rule], capture_output=True).returncode != 0:
+                subprocess.run(["iptables", "-I", *rule], check=True, capture_output=True, text=True)
 
-                # Update position
-                self.file_positions[log_file] = f.tell()
+            self.logger.info(f"Blocklist ipset ready: {self.BLOCK_SET}")
+            return True
+
+        except subprocess.CalledProcessError as e:
+            self.logger.critical(f"Failed to set up blocklist: {e.stderr}")
+        except FileNotFoundError as e:
+            self.logger.critical(f"Failed to set up blocklist (is ipset installed?): {e}")
+        return False
+
+    def _init_inotify(self) -> Optional[int]:
+        """
+        Watch the log directories with inotify so run() wakes on writes.
+
+        Directories are watched rather than the files so rotated or newly
+        created logs are noticed too; events for other files in the same
+        directory (e.g. syslog in /var/log) are filtered out by name in
+        _wait_for_changes(). Returns None (poll every CHECK_INTERVAL
+        seconds) if inotify is not available.
+        """
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(self._IN_NONBLOCK | self._IN_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+            files_by_dir: Dict[str, Dict[bytes, str]] = defaultdict(dict)
+            for log_file in self.LOG_FILES:
+                log_dir, name = os.path.split(log_file)
+                files_by_dir[log_dir][os.fsencode(name)] = log_file
+
+            mask = self._IN_MODIFY | self._IN_CREATE | self._IN_MOVED_TO
+            for log_dir, names in files_by_dir.items():
+                wd = libc.inotify_add_watch(fd, os.fsencode(log_dir), mask)
+                if wd < 0:
+                    self.logger.warning(f"Cannot watch {log_dir}; relying on timeout")
+                else:
+                    self._inotify_watches[wd] = names
+
+            self.logger.info("Waiting for log changes via inotify")
+            return fd
+
+        except (OSError, AttributeError, TypeError) as e:
+            self.logger.warning(f"inotify unavailable, polling every {self.CHECK_INTERVAL}s: {e}")
+            return None
+
+    def _wait_for_changes(self) -> Iterable[str]:
+        """
+        Block until a tailed log file changes (or the poll interval).
+
+        Returns:
+            The log files to re-read: those named by inotify events, or all
+            of them after a poll interval, timeout or event queue overflow
+        """
+        if self._inotify_fd is None:
+            time.sleep(self.CHECK_INTERVAL)
+            return self.LOG_FILES
+
+        deadline = time.monotonic() + self.INOTIFY_TIMEOUT
+        while self.running:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return self.LOG_FILES
+            readable, _, _ = select.select([self._inotify_fd], [], [], remaining)
+            if not readable:
+                return self.LOG_FILES
+
+            # Writes to unrelated files in a watched directory only wake us
+            # up; go back to waiting without re-reading anything
+            changed = self._read_inotify_events()
+            if changed:
+                return changed
+        return ()
+
+    def _read_inotify_events(self) -> Set[str]:
+        """Drain queued inotify events and return the tailed files they name."""
+        changed: Set[str] = set()
+        header = self._INOTIFY_EVENT
+        try:
+            while True:
+                buf = os.read(self._inotify_fd, 4096)
+                if not buf:
+                    break
+                offset = 0
+                while offset < len(buf):
+                    wd, _mask, _cookie, name_len = header.unpack_from(buf, offset)
+                    offset += header.size
+                    name = buf[offset:offset + name_len].rstrip(b"\0")
+                    offset += name_len
+
+                    if wd == -1:
+                        # IN_Q_OVERFLOW: events were lost, re-read everything
+                        changed.update(self.LOG_FILES)
+                    else:
+                        log_file = self._inotify_watches.get(wd, {}).get(name)
+                        if log_file is not None:
+                            changed.add(log_file)
+        except BlockingIOError:
+            pass
+        return changed
+
+    def _open_log(self, log_file: str, seek_end: bool) -> BinaryIO:
+        """Open log_file (binary) for tailing and remember its inode."""
+        fh = open(log_file, 'rb')
+        if seek_end:
+            fh.seek(0, 2)  # Seek to end
+        self.file_handles[log_file] = fh
+        self._file_inodes[log_file] = os.fstat(fh.fileno()).st_ino
+        return fh
+
+    def _close_log(self, log_file: str):
+        """Close the tail handle for log_file, if open."""
+        fh = self.file_handles.get(log_file)
+        if fh is not None:
+            fh.close()
+        self.file_handles[log_file] = None
+        self._partial_lines[log_file] = b""
+
+    def _read_new_lines(self, log_file: str) -> Iterator[bytes]:
+        """
+        Yield complete new lines from log_file since the last call.
+
+        The file stays open between calls, so each poll only reads what was
+        appended. Rotation (new inode) and truncation are detected after the
+        current handle is drained, and the new file is read from the start.
+        """
+        try:
+            fh = self.file_handles.get(log_file)
+            if fh is None:
+                if not Path(log_file).exists():
+                    return
+                fh = self._open_log(log_file, seek_end=False)
+
+            partial = self._partial_lines[log_file]
+            for line in iter(fh.readline, b''):
+                if not line.endswith(b'\n'):
+                    # Writer is mid-line; finish it on the next poll
+                    partial += line
+                    break
+                if partial:
+                    line, partial = partial + line, b""
+                yield line
+            self._partial_lines[log_file] = partial
+
+            # Detect rotation/truncation
+            try:
+                st = os.stat(log_file)
+            except FileNotFoundError:
+                self._close_log(log_file)
+                return
+            if st.st_ino != self._file_inodes[log_file]:
+                self._close_log(log_file)
+            elif st.st_size < fh.tell():
+                fh.seek(0)
+                self._partial_lines[log_file] = b""
 
         except Exception as e:
             self.logger.error(f"Error reading {log_file}: {e}")
 
-        return new_lines
+    def _extract_ip(self, line: bytes) -> Optional[str]:
+        """Extract IP address from log line (returned as str)."""
+        # A dotted quad needs a '.', and the substring test is far cheaper
+        # than running the regex engine
+        if b'.' not in line:
+            return None
 
-    def _extract_ip(self, line: str) -> Optional[str]:
-        """Extract IP address from log line."""
         match = self.IP_PATTERN.search(line)
         if match:
-            ip = match.group(0)
-            # Filter out invalid IPs (e.g., version numbers like 1.2.3.4)
-            octets = ip.split('.')
-            if all(0 <= int(octet) <= 255 for octet in octets):
+            # Matched digits and dots only, so ASCII decoding cannot fail
+            ip = match.group(0).decode('ascii')
+            # Filter out invalid IPs (octets over 255) with one C-level parse
+            try:
+                socket.inet_aton(ip)
                 return ip
+            except OSError:
+                pass
         return None
 
-    def _analyze_line(self, line: str, log_file: str):
+    @classmethod
+    def _classify_event(cls, line: bytes) -> Optional[str]:
+        """
+        Return the event type of a log line, or None if it has no event.
+
+        The fused search finds the leftmost keyword; the line from there on
+        is then checked only for types of higher priority, so a line is
+        classified like the per-type checks in EVENT_PATTERNS order.
+        """
+        match = cls.EVENT_PATTERN.search(line)
+        if not match:
+            return None
+
+        event_type = match.lastgroup
+        for name, pattern in cls.EVENT_PATTERNS:
+            if name == event_type:
+                break
+            if pattern.search(line, match.start()):
+                return name
+        return event_type
+
+    def _analyze_line(self, line: bytes, log_file: str):
         """Analyze log line for security events."""
+        # Classify first: most lines carry no event, and those skip the IP scan
+        event_type = self._classify_event(line)
+        if event_type is None:
+            return
+
         # Extract IP if present
         ip = self._extract_ip(line)
 
@@ -178,69 +464,35 @@ class LogWatcher:
             return
 
         current_time = time.time()
-        event_detected = False
-        event_type = None
-
-        # Check for authentication failures
-        for pattern in self.AUTH_FAILURE_PATTERNS:
-            if pattern.search(line):
-                event_type = "AUTH_FAILURE"
-                event_detected = True
-                break
 
-        # Check for DoS attacks
-        if not event_detected:
-            for pattern in self.DOS_PATTERNS:
-                if pattern.search(line):
-                    event_type = "DOS_ATTACK"
-                    event_detected = True
-                    break
-
-        # Check for unauthorized access
-        if not event_detected:
-            for pattern in self.UNAUTHORIZED_PATTERNS:
-                if pattern.search(line):
-                    event_type = "UNAUTHORIZED_ACCESS"
-                    event_detected = True
-                    break
+        # Record event
+        self._event_times[event_type][ip].append(current_time)
 
-        if event_detected:
-            # Record event
-            self.ip_events[ip].append({
-                "time": current_time,
-                "type": event_type,
-                "log_file": log_file,
-                "line": line.strip()
-            })
-
-            self.logger.info(
-                f"Security event detected from {ip}",
-                event_type=event_type,
-                ip=ip
-            )
+        self.logger.info(
+            f"Security event detected from {ip}",
+            event_type=event_type,
+            ip=ip,
+            log_file=log_file
+        )
 
-            # Check if IP should be blocked
-            self._check_and_block_ip(ip)
+        # Check if IP should be blocked
+        self._check_and_block_ip(ip, current_time)
 
-    def _check_and_block_ip(self, ip: str):
+    def _check_and_block_ip(self, ip: str, current_time: float):
         """Check if IP should be blocked based on event threshold."""
-        if ip in self.blocked_ips:
-            # Already blocked
-            return
-
-        current_time = time.time()
+        block_time = self.blocked_ips.get(ip)
+        if block_time is not None:
+            if current_time - block_time < self.BLOCK_DURATION:
+                # Already blocked
+                return
+            # The ipset entry has timed out; forget the block
+            del self.blocked_ips[ip]
         cutoff_time = current_time - self.TIME_WINDOW
 
-        # Count recent events
-        recent_events = [
-            event for event in self.ip_events[ip]
-            if event["time"] > cutoff_time
-        ]
-
-        # Count by event type
-        auth_failures = sum(1 for e in recent_events if e["type"] == "AUTH_FAILURE")
-        dos_events = sum(1 for e in recent_events if e["type"] == "DOS_ATTACK")
-        unauth_events = sum(1 for e in recent_events if e["type"] == "UNAUTHORIZED_ACCESS")
+        # Count recent events by type
+        auth_failures = self._recent_count(self.auth_times, ip, cutoff_time)
+        dos_events = self._recent_count(self.dos_times, ip, cutoff_time)
+        unauth_events = self._recent_count(self.unauth_times, ip, cutoff_time)
 
         should_block = False
         reason = None
@@ -258,10 +510,37 @@ class LogWatcher:
             reason = f"{unauth_events} unauthorized access attempts"
 
         if should_block:
-            self._block_ip(ip, reason)
+            self._block_ip(ip, reason, current_time)
+
+    @staticmethod
+    def _recent_count(times_by_ip: Dict[str, deque], ip: str, cutoff_time: float) -> int:
+        """Drop timestamps at or before cutoff_time and return how many remain."""
+        times = times_by_ip.get(ip)
+        if not times:
+            return 0
+        while times and times[0] <= cutoff_time:
+            times.popleft()
+        return len(times)
+
+    def _forget_expired_blocks(self, current_time: float):
+        """
+        Drop blocked_ips entries whose ipset timeout has passed.
+
+        Entries are inserted in block-time order (an expired IP is deleted
+        before it is re-added), so expired ones sit at the front and the
+        scan stops at the first block still in force.
+        """
+        cutoff_time = current_time - self.BLOCK_DURATION
+        expired = []
+        for ip, block_time in self.blocked_ips.items():
+            if block_time > cutoff_time:
+                break
+            expired.append(ip)
+        for ip in expired:
+            del self.blocked_ips[ip]
 
-    def _block_ip(self, ip: str, reason: str):
-        """Block IP address using iptables."""
+    def _block_ip(self, ip: str, reason: str, current_time: float):
+        """Block IP address by adding it to the blocklist ipset."""
         self.logger.security_event(
             "IP_BLOCKED",
             "CRITICAL",
@@ -273,32 +552,33 @@ class LogWatcher:
         )
 
         try:
-            # Add iptables rule to drop packets from this IP
+            # Add IP to the blocklist set; the kernel drops it on timeout
             cmd = [
-                "iptables",
-                "-I", "INPUT",  # Insert at top of chain
-                "-s", ip,
-                "-j", "DROP"
+                "ipset", "add", self.BLOCK_SET, ip,
+                "timeout", str(self.BLOCK_DURATION),
+                "-exist"
             ]
 
-            result = subprocess.run(
+            subprocess.run(
                 cmd,
                 check=True,
                 capture_output=True,
                 text=True
             )
 
-            # Record block
-            self.blocked_ips[ip] = time.time()
+            # Record block (after forgetting expired ones, so the table only
+            # holds IPs the kernel is still dropping)
+            self._forget_expired_blocks(current_time)
+            self.blocked_ips[ip] = current_time
 
             self.logger.critical(
-                f"IP {ip} blocked via iptables",
+                f"IP {ip} blocked via ipset {self.BLOCK_SET}",
                 ip=ip,
                 reason=reason
             )
 
             # Publish critical alert (if MQTT available)
-            self._publish_critical_alert(ip, reason)
+            self._publish_critical_alert(ip, reason, current_time)
 
         except subprocess.CalledProcessError as e:
             self.logger.error(
@@ -308,55 +588,20 @@ class LogWatcher:
         except Exception as e:
             self.logger.error(f"Error blocking IP: {e}", ip=ip)
 
-    def _unblock_ip(self, ip: str):
-        """Remove IP block from iptables."""
-        self.logger.info(f"Unblocking IP: {ip}")
+    def _alert_timestamp(self, current_time: float) -> str:
+        """Format current_time as ISO 8601 UTC (whole seconds), cached per second."""
+        sec = int(current_time)
+        if sec != self._ts_last_sec:
+            self._ts_cached = datetime.utcfromtimestamp(sec).strftime("%Y-%m-%dT%H:%M:%SZ")
+            self._ts_last_sec = sec
+        return self._ts_cached
 
+    def _publish_critical_alert(self, ip: str, reason: str, current_time: float):
+        """Publish critical alert to MQTT (skipped while not connected)."""
         try:
-            # Remove iptables rule
-            cmd = [
-                "iptables",
-                "-D", "INPUT",
-                "-s", ip,
-                "-j", "DROP"
-            ]
-
-            subprocess.run(cmd, check=True, capture_output=True)
-
-            # Remove from blocked list
-            del self.blocked_ips[ip]
-
-            self.logger.info(f"IP {ip} unblocked", ip=ip)
-
-        except subprocess.CalledProcessError as e:
-            self.logger.error(f"Failed to unblock IP {ip}: {e.stderr}")
-        except Exception as e:
-            self.logger.error(f"Error unblocking IP: {e}")
-
-    def _check_block_expiry(self):
-        """Check if any blocks have expired and remove them."""
-        current_time = time.time()
-
-        for ip, block_time in list(self.blocked_ips.items()):
-            if current_time - block_time >= self.BLOCK_DURATION:
-                self._unblock_ip(ip)
-
-    def _publish_critical_alert(self, ip: str, reason: str):
-        """Publish critical alert to MQTT (optional, requires MQTT client)."""
-        try:
-            # Import here to avoid dependency if MQTT is not available
-            from modules.mqtt_client import SecureMQTTClient
-
-            client = SecureMQTTClient(
-                client_id="logwatcher_alert",
-                username=None,
-                password=None,
-                ca_cert_path=None
-            )
-
-            if client.connect(retry=False):
+            if self.mqtt_client is not None and self.mqtt_client.connected:
                 alert = {
-                    "timestamp": datetime.utcnow().isoformat() + "Z",
+                    "timestamp": self._alert_timestamp(current_time),
                     "source": "log_watcher",
                     "severity": "CRITICAL",
                     "message": f"IP {ip} has been blocked",
@@ -365,40 +610,40 @@ class LogWatcher:
                     "block_duration_seconds": self.BLOCK_DURATION
                 }
 
-                client.publish("safenest/alerts/critical", json.dumps(alert))
-                client.disconnect()
+                self.mqtt_client.publish("safenest/alerts/critical", json_utils.dumpb(alert))
 
         except Exception as e:
             # Don't fail if MQTT is not available
             self.logger.debug(f"Could not publish MQTT alert: {e}")
 
-    def _monitor_logs(self):
-        """Monitor all log files for new entries."""
-        for log_file in self.LOG_FILES:
-            new_lines = self._read_new_lines(log_file)
-
-            for line in new_lines:
-                self._analyze_line(line, log_file)
+    def _monitor_logs(self, log_files: Iterable[str]):
+        """Read new entries from log_files and queue them for analysis."""
+        for log_file in log_files:
+            for line in self._read_new_lines(log_file):
+                self._lines_q.put((line, log_file))
+
+    def _classifier_loop(self):
+        """Analyze queued log lines until the None sentinel arrives."""
+        while True:
+            item = self._lines_q.get()
+            if item is None:
+                return
+            try:
+                self._analyze_line(*item)
+            except Exception as e:
+                self.logger.error(f"Error analyzing log line: {e}", log_file=item[1])
 
     def run(self):
         """Main monitoring loop."""
         try:
             self.logger.info("Monitoring log files for security events...")
 
-            check_interval = 2  # Check logs every 2 seconds
-            expiry_check_interval = 60  # Check block expiry every minute
-            last_expiry_check = time.time()
-
+            changed: Iterable[str] = self.LOG_FILES
             while self.running:
-                # Monitor logs
-                self._monitor_logs()
-
-                # Check for expired blocks
-                if time.time() - last_expiry_check >= expiry_check_interval:
-                    self._check_block_expiry()
-                    last_expiry_check = time.time()
+                # Monitor logs (block expiry is handled by the ipset timeout)
+                self._monitor_logs(changed)
 
-                time.sleep(check_interval)
+                changed = self._wait_for_changes()
 
         except KeyboardInterrupt:
             self.logger.info("Keyboard interrupt received")
@@ -412,9 +657,35 @@ class LogWatcher:
         self.logger.info("Stopping Log Watcher...")
         self.running = False
 
+        # Let the classifier finish lines already read, then exit
+        if self._classifier_thread is not None:
+            try:
+                self._lines_q.put(None, timeout=5)
+            except queue.Full:
+                # Still flooded: drop the backlog so the sentinel fits (the
+                # reader has stopped, so nothing refills the queue)
+                self.logger.warning("Line queue full at shutdown, discarding unclassified lines")
+                try:
+                    while True:
+                        self._lines_q.get_nowait()
+                except queue.Empty:
+                    pass
+                self._lines_q.put_nowait(None)
+            self._classifier_thread.join(timeout=5)
+            self._classifier_thread = None
+
+        for log_file in self.LOG_FILES:
+            self._close_log(log_file)
+
+        if self._inotify_fd is not None:
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+
+        if self.mqtt_client is not None:
+            self.mqtt_client.disconnect()
+
         # Optionally unblock all IPs on shutdown (uncomment if desired)
-        # for ip in list(self.blocked_ips.keys()):
-        #     self._unblock_ip(ip)
+        # subprocess.run(["ipset", "flush", self.BLOCK_SET], capture_output=True)
 
         self.logger.info("Log Watcher stopped")
 
@@ -427,9 +698,9 @@ def signal_handler(signum, frame):
 
 def main():
     """Main entry point."""
-    # Check if running as root (required for iptables)
+    # Check if running as root (required for ipset/iptables)
     if subprocess.run(["id", "-u"], capture_output=True, text=True).stdout.strip() != "0":
-        print("ERROR: This script must be run as root (sudo) to use iptables", file=sys.stderr)
+        print("ERROR: This script must be run as root (sudo) to use ipset/iptables", file=sys.stderr)
         print("Usage: sudo python3 safenest_logwatcher.py", file=sys.stderr)
         sys.exit(1)
 
@@ -15,10 +15,13 @@ Access at: http://192.168.1.10:5000
 """
 
 import sys
-import json
 import os
+import hashlib
+import time
+from collections import deque
 from pathlib import Path
-from flask import Flask, render_template_string
+from types import MappingProxyType
+from flask import Flask, Response, request, stream_with_context
 from threading import Thread
 
 # Add modules directory to path
@@ -26,127 +29,82 @@ sys.path.insert(0, str(Path(__file__).parent))
 
 from modules.mqtt_client import SecureMQTTClient
 from modules.logging_utils import get_logger
+from modules import json_utils
 
 app = Flask(__name__)
 
-# Store latest device states
-device_states = {
+# Badge CSS class for each state value, computed once per state change
+# (stored as "<key>_cls") instead of in the template on every render
+_BADGE_CLASS = {
+    "light1": lambda v: "status-on" if v == "ON" else "status-off",
+    "light2": lambda v: "status-on" if v == "ON" else "status-off",
+    "motion": lambda v: "status-motion" if v == "motion_detected" else "status-idle",
+    "system_armed": lambda v: "status-armed" if v else "status-disarmed",
+}
+
+# Latest device states, mutated only by the MQTT listener thread
+_state_builder = {
     "light1": "UNKNOWN",
     "light2": "UNKNOWN",
     "motion": "idle",
     "intercom": "idle",
-    "alerts": [],
+    "alerts": deque(maxlen=50),  # Newest first; oldest drop off the end
     "system_armed": False
 }
+_state_builder.update({f"{key}_cls": cls(_state_builder[key]) for key, cls in _BADGE_CLASS.items()})
 
-logger = get_logger("web_dashboard", console=True)
-
-# Track MQTT connectivity
-mqtt_client = None
-mqtt_connected = False
-
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html>
-<head>
-    <title>SafeNest Dashboard</title>
-    <meta http-equiv="refresh" content="2">
-    <style>
-        * { margin: 0; padding: 0; box-sizing: border-box; }
-
-        :root {
-            --bg-dark: #0b0921;
-            --bg-darker: #07061A;
-            --purple-3: #7c3aed;
-            --purple-4: #a78bfa;
-            --accent-cyan: #22d3ee;
-            --accent-pink: #fb7185;
-            --text: #E5E7EB;
-            --card: rgba(17, 24, 39, 0.65);
-            --glass: rgba(31, 41, 55, 0.5);
-            --neon-shadow: 0 0 20px rgba(167,139,250,0.35), 0 0 40px rgba(124,58,237,0.25);
-        }
-
-        body {
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', 'Roboto', 'Oxygen', 'Ubuntu', sans-serif;
-            background:
-                radial-gradient(1200px 600px at 10% 0%, rgba(124,58,237,0.25), transparent 60%),
-                radial-gradient(800px 400px at 90% 20%, rgba(34,211,238,0.15), transparent 60%),
-                radial-gradient(600px 300px at 30% 80%, rgba(251,113,133,0.18), transparent 60%),
-                linear-gradient(135deg, var(--bg-darker) 0%, var(--bg-dark) 100%);
-            padding: 24px; min-height: 100vh; color: var(--text);
-        }
-
-        .container {
-            max-width: 1200px;
-            margin: 0 auto;
-        }
-
-        .header {
-            background: var(--glass);
-            padding: 24px 32px;
-            border-radius: 18px;
-            margin-bottom: 24px;
-            box-shadow: var(--neon-shadow);
-            border: 1px solid rgba(167,139,250,0.25);
-            backdrop-filter: saturate(140%) blur(10px);
-        }
 
-        .header h1 { color: var(--purple-4); margin-bottom: 6px; font-weight: 800; text-shadow: 0 0 12px rgba(167,139,250,0.35); }
+def _snapshot_states():
+    """Read-only copy of _state_builder (alerts frozen as a tuple)."""
+    return MappingProxyType(dict(_state_builder, alerts=tuple(_state_builder["alerts"])))
 
-        .header p { color: #cbd5e1; font-size: 14px; }
 
-        .grid { display: grid; grid-template-columns: repeat(auto-fit, minmax(300px, 1fr)); gap: 24px; margin-bottom: 24px; }
+# Immutable snapshot read by request handlers. The listener rebinds this
+# name after each update (a single atomic store), so readers never see a
+# half-applied change and no lock is needed.
+device_states = _snapshot_states()
 
-        .card { background: var(--card); padding: 24px; border-radius: 18px; box-shadow: var(--neon-shadow); border: 1px solid rgba(124,58,237,0.25); }
+# Bumped after each new snapshot is published; with the per-process boot ID
+# it forms the ETag of the page and of /state
+state_version = 0
+_BOOT_ID = os.urandom(4).hex()
 
-        .card h2 { font-size: 18px; color: var(--purple-4); margin-bottom: 15px; border-bottom: 2px solid var(--purple-3); padding-bottom: 10px; }
 
-        .device-status { display: flex; justify-content: space-between; align-items: center; padding: 12px; margin: 8px 0; background: rgba(67,56,202,0.20); border-radius: 10px; border: 1px solid rgba(67,56,202,0.35); }
+# Last fully rendered page: ((state_version, epoch second), HTML bytes).
+# Output only depends on the state and the displayed time, so concurrent
+# requests within one second share a single render.
+_page_cache = ((-1, -1), b"")
 
-        .device-name { font-weight: 700; color: var(--text); }
 
-        .status-badge { padding: 8px 16px; border-radius: 20px; font-size: 12px; font-weight: 800; text-transform: uppercase; border: 1px solid rgba(167,139,250,0.3); box-shadow: var(--neon-shadow); }
+def _publish_states():
+    """Publish a new snapshot, then bump state_version (in that order)."""
+    global device_states, state_version
+    device_states = _snapshot_states()
+    # A reader that sees the new version is guaranteed the new snapshot; one
+    # that sees the old version at worst sends fresh data under a stale ETag
+    state_version += 1
 
-        .status-on { background: linear-gradient(135deg, #34d399 0%, #10b981 100%); color: #062e25; }
+# Identical consecutive alerts within this many seconds are shown once
+ALERT_DEDUP_WINDOW = 0.2
 
-        .status-off { background: linear-gradient(135deg, #a78bfa 0%, #7c3aed 100%); color: #1a093b; }
-
-        .status-motion { background: linear-gradient(135deg, #fb7185 0%, #f59e0b 100%); color: #3a0a0a; animation: pulse 1s infinite; }
-
-        .status-idle { background: linear-gradient(135deg, #64748b 0%, #475569 100%); color: #0a1117; }
-
-        .status-armed { background: linear-gradient(135deg, #fb7185 0%, #ef4444 100%); color: #3d0d0d; font-weight: 800; }
-
-        .status-disarmed { background: linear-gradient(135deg, #a78bfa 0%, #7c3aed 100%); color: #1a093b; }
-
-        .alert-item { padding: 14px; margin: 10px 0; border-radius: 10px; border-left: 4px solid; }
-
-        .alert-critical { background: rgba(239,68,68,0.2); border-color: #ef4444; color: #fecaca; }
-
-        .alert-warn { background: rgba(245,158,11,0.18); border-color: #f59e0b; color: #fde68a; }
-
-        .alert-info { background: rgba(59,130,246,0.18); border-color: #3b82f6; color: #bfdbfe; }
-
-        .alert-time { font-size: 12px; color: #cbd5e1; margin-bottom: 5px; }
-
-        .alert-message { font-weight: 700; }
-
-        .no-alerts { text-align: center; padding: 40px; color: #9ca3af; }
+logger = get_logger("web_dashboard", console=True)
 
-        @keyframes pulse {
-            0%, 100% { opacity: 1; }
-            50% { opacity: 0.7; }
-        }
+# Track MQTT connectivity
+mqtt_client = None
+mqtt_connected = False
 
-        .footer { text-align: center; color: var(--text); margin-top: 20px; font-size: 14px; }
-    </style>
+HTML_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>SafeNest Dashboard</title>
+    <link rel="stylesheet" href="{{ url_for('static', filename='dashboard.css', v=css_version) }}">
 </head>
 <body>
     <div class="container">
         <div class="header">
             <h1>🏠 SafeNest Security Dashboard</h1>
-            <p>Real-time monitoring | Last updated: {{ current_time }}</p>
+            <p>Real-time monitoring | Last updated: <span id="last-updated">{{ current_time }}</span></p>
         </div>
 
         <div class="grid">
@@ -155,13 +113,13 @@ HTML_TEMPLATE = """
                 <h2>💡 Lights</h2>
                 <div class="device-status">
                     <span class="device-name">Light 1</span>
-                    <span class="status-badge {% if states.light1 == 'ON' %}status-on{% else %}status-off{% endif %}">
+                    <span id="light1" class="status-badge {{ states.light1_cls }}">
                         {{ states.light1 }}
                     </span>
                 </div>
                 <div class="device-status">
                     <span class="device-name">Light 2</span>
-                    <span class="status-badge {% if states.light2 == 'ON' %}status-on{% else %}status-off{% endif %}">
+                    <span id="light2" class="status-badge {{ states.light2_cls }}">
                         {{ states.light2 }}
                     </span>
                 </div>
@@ -172,13 +130,13 @@ HTML_TEMPLATE = """
                 <h2>📡 Sensors</h2>
                 <div class="device-status">
                     <span class="device-name">Motion Sensor</span>
-                    <span class="status-badge {% if states.motion == 'motion_detected' %}status-motion{% else %}status-idle{% endif %}">
+                    <span id="motion" class="status-badge {{ states.motion_cls }}">
                         {{ states.motion }}
                     </span>
                 </div>
                 <div class="device-status">
                     <span class="device-name">Intercom</span>
-                    <span class="status-badge status-idle">
+                    <span id="intercom" class="status-badge status-idle">
                         {{ states.intercom }}
                     </span>
                 </div>
@@ -189,13 +147,13 @@ HTML_TEMPLATE = """
                 <h2>⚙️ System Status</h2>
                 <div class="device-status">
                     <span class="device-name">Security System</span>
-                    <span class="status-badge {% if states.system_armed %}status-armed{% else %}status-disarmed{% endif %}">
+                    <span id="system_armed" class="status-badge {{ states.system_armed_cls }}">
                         {% if states.system_armed %}ARMED{% else %}DISARMED{% endif %}
                     </span>
                 </div>
                 <div class="device-status">
                     <span class="device-name">Total Alerts</span>
-                    <span class="status-badge" style="background: #667eea; color: white;">
+                    <span id="alert-count" class="status-badge" style="background: #667eea; color: white;">
                         {{ states.alerts|length }}
                     </span>
                 </div>
@@ -205,8 +163,9 @@ HTML_TEMPLATE = """
         <!-- Alerts Section -->
         <div class="card">
             <h2>🚨 Security Alerts</h2>
+            <div id="alerts">
             {% if states.alerts %}
-                {% for alert in states.alerts[:10] %}
+                {% for alert in recent_alerts %}
                 <div class="alert-item alert-{{ alert.severity }}">
                     <div class="alert-time">{{ alert.time }}</div>
                     <div class="alert-message">{{ alert.message }}</div>
@@ -218,16 +177,87 @@ HTML_TEMPLATE = """
                     <p style="font-size: 12px; margin-top: 10px;">System operating normally</p>
                 </div>
             {% endif %}
+            </div>
         </div>
 
         <div class="footer">
             SafeNest v1.0 | Capstone Project | Auto-refresh every 2 seconds
         </div>
     </div>
+    <script>
+        // Poll /state and patch the badges in place instead of reloading the page
+        function setBadge(id, text, cls) {
+            const el = document.getElementById(id);
+            el.textContent = text;
+            el.className = "status-badge " + cls;
+        }
+
+        function renderAlerts(alerts) {
+            const box = document.getElementById("alerts");
+            box.replaceChildren();
+            if (!alerts.length) {
+                box.innerHTML = '<div class="no-alerts"><p>✅ No security alerts</p>' +
+                    '<p style="font-size: 12px; margin-top: 10px;">System operating normally</p></div>';
+                return;
+            }
+            for (const alert of alerts.slice(0, 10)) {
+                const item = document.createElement("div");
+                item.className = "alert-item alert-" + alert.severity;
+                const time = document.createElement("div");
+                time.className = "alert-time";
+                time.textContent = alert.time;
+                const message = document.createElement("div");
+                message.className = "alert-message";
+                message.textContent = alert.message;
+                item.append(time, message);
+                box.append(item);
+            }
+        }
+
+        let lastEtag = null;
+
+        function refresh() {
+            // The server answers 304 while state is unchanged; the browser then
+            // hands back the cached body with the same ETag, so skip the DOM work
+            fetch("/state").then(r => {
+                const etag = r.headers.get("ETag");
+                if (etag && etag === lastEtag) return null;
+                lastEtag = etag;
+                return r.json();
+            }).then(s => {
+                if (!s) return;
+                setBadge("light1", s.light1, s.light1_cls);
+                setBadge("light2", s.light2, s.light2_cls);
+                setBadge("motion", s.motion, s.motion_cls);
+                setBadge("intercom", s.intercom, "status-idle");
+                setBadge("system_armed", s.system_armed ? "ARMED" : "DISARMED", s.system_armed_cls);
+                document.getElementById("alert-count").textContent = s.alerts.length;
+                renderAlerts(s.alerts);
+                const now = new Date();
+                const pad = n => String(n).padStart(2, "0");
+                document.getElementById("last-updated").textContent =
+                    now.getFullYear() + "-" + pad(now.getMonth() + 1) + "-" + pad(now.getDate()) + " " +
+                    pad(now.getHours()) + ":" + pad(now.getMinutes()) + ":" + pad(now.getSeconds());
+            }).catch(() => {});
+        }
+
+        setInterval(refresh, 2000);
+    </script>
 </body>
 </html>
 """
 
+# Stylesheet content hash, used as a cache-busting query string so the
+# far-future Cache-Control on /static is safe across upgrades
+_STATIC_DIR = Path(__file__).parent / "static"
+app.jinja_env.globals["css_version"] = hashlib.sha1(
+    (_STATIC_DIR / "dashboard.css").read_bytes()
+).hexdigest()[:12]
+
+# Parse and compile the template once; requests only execute it
+app.jinja_env.auto_reload = False
+_TEMPLATE = app.jinja_env.from_string(HTML_TEMPLATE)
+
 
 def mqtt_listener():
     """Background thread to listen to MQTT and update states."""
@@ -241,34 +271,70 @@ def mqtt_listener():
         ca_cert_path=None
     )
 
+    def set_state(key, value):
+        # Repeated reports of the same value (e.g. a flood of identical
+        # motion messages) leave the snapshot and its ETag untouched
+        if _state_builder.get(key) == value:
+            return
+        _state_builder[key] = value
+        if key in _BADGE_CLASS:
+            _state_builder[f"{key}_cls"] = _BADGE_CLASS[key](value)
+        _publish_states()
+
     def on_light1(topic, payload):
-        device_states["light1"] = payload
+        set_state("light1", payload)
 
     def on_light2(topic, payload):
-        device_states["light2"] = payload
+        set_state("light2", payload)
 
     def on_motion(topic, payload):
-        device_states["motion"] = payload
+        set_state("motion", payload)
 
     def on_intercom(topic, payload):
-        device_states["intercom"] = payload
+        set_state("intercom", payload)
+
+    # (severity, message) of the newest alert and when it arrived, for
+    # dropping identical alerts repeated within ALERT_DEDUP_WINDOW
+    last_alert = [None, 0.0]
 
     def on_alert(topic, payload):
         try:
-            alert_data = json.loads(payload)
-            severity = topic.split('/')[-1]  # info, warn, critical
-
-            alert = {
-                "time": alert_data.get("timestamp", "Unknown"),
-                "message": alert_data.get("message", payload),
-                "severity": severity
-            }
-
-            # Add to front of list, keep last 50
-            device_states["alerts"].insert(0, alert)
-            device_states["alerts"] = device_states["alerts"][:50]
-
-        except:
+            # payload is raw bytes (subscribed with raw=True)
+            alert_data = json_utils.loads(payload)
+            severity = topic.rpartition('/')[2]  # info, warn, critical, batch
+
+            # safenest/alerts/batch carries a JSON array of coalesced alerts
+            if isinstance(alert_data, list):
+                batch = alert_data
+            else:
+                batch = [alert_data]
+
+            added = False
+            now = time.monotonic()
+            for item in batch:
+                message = item.get("message")
+                if message is None:
+                    message = payload.decode("utf-8", "replace")
+                alert = {
+                    "time": item.get("timestamp", "Unknown"),
+                    "message": message,
+                    "severity": item.get("severity", severity) if severity == "batch" else severity
+                }
+
+                signature = (alert["severity"], message)
+                if signature == last_alert[0] and now - last_alert[1] < ALERT_DEDUP_WINDOW:
+                    continue
+                last_alert[0], last_alert[1] = signature, now
+
+                # Add to front; the deque's maxlen keeps the last 50
+                _state_builder["alerts"].appendleft(alert)
+                added = True
+
+            if added:
+                _publish_states()
+
+        except (ValueError, AttributeError):
+            # Not JSON, or not a JSON object
             pass
 
     if mqtt_client.connect(retry=True):
@@ -277,43 +343,117 @@ def mqtt_listener():
         mqtt_client.subscribe("safenest/light2/state", on_light2)
         mqtt_client.subscribe("safenest/motion/state", on_motion)
         mqtt_client.subscribe("safenest/intercom/event", on_intercom)
-        mqtt_client.subscribe("safenest/alerts/#", on_alert)
+        mqtt_client.subscribe("safenest/alerts/#", on_alert, raw=True)
 
+        # paho's own network thread (started by connect()) now delivers
+        # messages and handles reconnects; this thread has nothing left to do
         logger.info("MQTT listener started")
 
-        # Keep thread alive
-        import time
-        while True:
-            time.sleep(1)
-    
+
+def _json_response(obj, status: int = 200) -> Response:
+    """JSON response serialized with json_utils (orjson when installed)."""
+    return Response(json_utils.dumpb(obj), status=status, mimetype="application/json")
+
+
+def _etag(kind: str, version: int) -> str:
+    """Weak ETag for a state-derived response."""
+    return f'W/"{kind}-{_BOOT_ID}-{version}"'
+
+
+def _not_modified(etag: str):
+    """304 response if the client already holds this version, else None."""
+    if request.headers.get("If-None-Match") == etag:
+        response = Response(status=304)
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+    return None
+
+
+def _with_etag(response: Response, etag: str) -> Response:
+    """Tag a response; no-cache makes browsers revalidate on every poll."""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.after_request
+def cache_static(response):
+    """Let browsers keep static assets; their URLs change with their content."""
+    if request.path.startswith("/static/"):
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
 
 @app.route('/')
 def dashboard():
-    """Render dashboard."""
+    """Render dashboard, streaming it so the static <head> is sent first."""
     from datetime import datetime
-    return render_template_string(
-        HTML_TEMPLATE,
-        states=device_states,
-        current_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # Version before snapshot (see _publish_states)
+    version = state_version
+    etag = _etag("page", version)
+    cached = _not_modified(etag)
+    if cached is not None:
+        return cached
+
+    now = time.time()
+    key = (version, int(now))
+    cached_key, body = _page_cache
+    if cached_key == key:
+        return _with_etag(Response(body, mimetype="text/html"), etag)
+
+    states = device_states  # One consistent snapshot for the whole render
+    stream = _TEMPLATE.stream(
+        states=states,
+        recent_alerts=states["alerts"][:10],
+        current_time=datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S")
     )
+    stream.enable_buffering(5)
+
+    def generate():
+        # Stream as usual, keeping a copy for requests later in this second
+        global _page_cache
+        chunks = []
+        for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+        _page_cache = (key, "".join(chunks).encode("utf-8"))
+
+    return _with_etag(Response(stream_with_context(generate()), mimetype="text/html"), etag)
+
+
+@app.route('/state')
+def state():
+    """Current device states as JSON (polled by the dashboard page)."""
+    etag = _etag("state", state_version)
+    cached = _not_modified(etag)
+    if cached is not None:
+        return cached
+    return _with_etag(_json_response(dict(device_states)), etag)
 
 
 @app.route('/health')
 def health():
     """Health endpoint to verify server and MQTT connectivity."""
-    return {
+    return _json_response({
         "status": "ok",
-        "mqtt_connected": bool(mqtt_client and mqtt_connected)
-    }, 200
+        "mqtt_connected": bool(mqtt_client and mqtt_connected and mqtt_client.connected)
+    })
+
+
+def start_mqtt_listener() -> Thread:
+    """Start the MQTT listener thread (also called by the gunicorn config)."""
+    mqtt_thread = Thread(target=mqtt_listener, daemon=True)
+    mqtt_thread.start()
+    return mqtt_thread
 
 
 def main():
-    """Main entry point."""
+    """Main entry point (development server; use gunicorn in production)."""
     logger.info("Starting SafeNest Web Dashboard...")
 
     # Start MQTT listener in background
-    mqtt_thread = Thread(target=mqtt_listener, daemon=True)
-    mqtt_thread.start()
+    start_mqtt_listener()
 
     ports_to_try = [int(os.environ.get("DASHBOARD_PORT", "5000")), 5001, 5002]
     for port in ports_to_try:
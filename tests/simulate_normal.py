@@ -23,7 +23,8 @@ Arguments:
 """
 
 import sys
-import time
+import asyncio
+import functools
 import random
 import argparse
 from pathlib import Path
@@ -34,6 +35,16 @@ sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 from modules.mqtt_client import SecureMQTTClient
 from modules.logging_utils import get_logger
 
+# Broker connection settings shared by every simulated client
+_make_client = functools.partial(
+    SecureMQTTClient,
+    broker_host="192.168.1.10",
+    broker_port=1883,
+    username=None,
+    password=None,
+    ca_cert_path=None
+)
+
 
 class NormalBehaviorSimulator:
     """Simulates normal smart home device behavior."""
@@ -42,127 +53,109 @@ class NormalBehaviorSimulator:
         """Initialize simulator."""
         self.logger = get_logger("simulator_normal", console=True)
 
-        # Initialize MQTT clients for different devices
-        self.clients = {}
-
-        self._init_clients()
-
-    def _init_clients(self):
-        """Initialize MQTT clients for each simulated device."""
-        devices = [
-            ("motion_sensor", "motion_user", "MotionPass123!"),
-            ("light1", "light1_user", "Light1Pass123!"),
-            ("light2", "light2_user", "Light2Pass123!"),
-            ("intercom", "intercom_user", "IntercomPass123!"),
-        ]
-
-        for client_id, username, password in devices:
-            try:
-                client = SecureMQTTClient(
-                    client_id=f"sim_{client_id}",
-                    broker_host="192.168.1.10",
-                    broker_port=1883,
-                    username=None,
-                    password=None,
-                    ca_cert_path=None
-                )
-
-                if client.connect(retry=False):
-                    self.clients[client_id] = client
-                    self.logger.info(f"Connected {client_id}")
-                else:
-                    self.logger.error(f"Failed to connect {client_id}")
-
-            except Exception as e:
-                self.logger.error(f"Error initializing {client_id}: {e}")
-
-    def simulate_motion_sensor(self):
+        # One shared MQTT connection for all simulated devices (publish only
+        # queues the message for paho's network thread, so the device
+        # coroutines below can call it directly)
+        self.client = None
+
+        self._init_client()
+
+    def _init_client(self):
+        """Connect the shared MQTT client used by every simulated device."""
+        try:
+            client = _make_client(client_id="sim_normal")
+
+            if client.connect(retry=False):
+                self.client = client
+                self.logger.info("Connected to MQTT broker")
+            else:
+                self.logger.error("Failed to connect to MQTT broker")
+
+        except Exception as e:
+            self.logger.error(f"Error initializing MQTT client: {e}")
+
+    def _publish(self, topic: str, payload: str):
+        """Publish a device message if the broker connection is up."""
+        if self.client is not None:
+            self.client.publish(topic, payload)
+
+    @staticmethod
+    async def _report_interval():
+        """Wait 5-10 seconds between device reports (realistic interval)."""
+        await asyncio.sleep(random.uniform(5, 10))
+
+    async def simulate_motion_sensor(self):
         """Simulate motion sensor events."""
-        if "motion_sensor" not in self.clients:
-            return
-
-        # Random motion detection (20% chance)
-        if random.random() < 0.2:
-            self.clients["motion_sensor"].publish(
-                "safenest/motion/state",
-                "motion_detected"
-            )
-            self.logger.info("Motion detected")
-
-            # Motion clears after 2-5 seconds
-            time.sleep(random.uniform(2, 5))
-
-            self.clients["motion_sensor"].publish(
-                "safenest/motion/state",
-                "idle"
-            )
-            self.logger.info("Motion cleared")
-        else:
-            # No motion
-            self.clients["motion_sensor"].publish(
-                "safenest/motion/state",
-                "idle"
-            )
-
-    def simulate_light_state(self, light_id: str):
+        while True:
+            # Random motion detection (20% chance)
+            if random.random() < 0.2:
+                self._publish("safenest/motion/state", "motion_detected")
+                self.logger.info("Motion detected")
+
+                # Motion clears after 2-5 seconds (other devices keep running)
+                await asyncio.sleep(random.uniform(2, 5))
+
+                self._publish("safenest/motion/state", "idle")
+                self.logger.info("Motion cleared")
+            else:
+                # No motion
+                self._publish("safenest/motion/state", "idle")
+
+            await self._report_interval()
+
+    async def simulate_light_state(self, light_id: str):
         """Simulate light state updates."""
-        if light_id not in self.clients:
-            return
+        while True:
+            # Lights report their current state periodically
+            # Randomly choose ON or OFF (simulate normal usage)
+            state = random.choice(["ON", "OFF"])
 
-        # Lights report their current state periodically
-        # Randomly choose ON or OFF (simulate normal usage)
-        state = random.choice(["ON", "OFF"])
+            self._publish(f"safenest/{light_id}/state", state)
 
-        self.clients[light_id].publish(
-            f"safenest/{light_id}/state",
-            state
-        )
+            self.logger.info(f"{light_id}: {state}")
 
-        self.logger.info(f"{light_id}: {state}")
+            await self._report_interval()
 
-    def simulate_intercom(self):
+    async def simulate_intercom(self):
         """Simulate intercom events."""
-        if "intercom" not in self.clients:
-            return
+        while True:
+            # Occasional doorbell or door opening (5% chance)
+            if random.random() < 0.05:
+                event = random.choice(["call_button_pressed", "door_opened"])
 
-        # Occasional doorbell or door opening (5% chance)
-        if random.random() < 0.05:
-            event = random.choice(["call_button_pressed", "door_opened"])
+                self._publish("safenest/intercom/event", event)
 
-            self.clients["intercom"].publish(
-                "safenest/intercom/event",
-                event
-            )
+                self.logger.info(f"Intercom: {event}")
 
-            self.logger.info(f"Intercom: {event}")
+            await self._report_interval()
+
+    async def _run_devices(self, duration: int):
+        """Run every device as its own coroutine until duration elapses."""
+        devices = asyncio.gather(
+            self.simulate_motion_sensor(),
+            self.simulate_light_state("light1"),
+            self.simulate_light_state("light2"),
+            self.simulate_intercom(),
+        )
+        try:
+            await asyncio.wait_for(devices, timeout=duration)
+        except asyncio.TimeoutError:
+            pass
 
     def run(self, duration: int = 60):
         """
         Run normal behavior simulation.
 
+        Each device runs on its own timing loop, so (for example) a motion
+        event waiting to clear does not hold up the light reports.
+
         Args:
             duration: Simulation duration in seconds
         """
         self.logger.info(f"Starting normal behavior simulation for {duration} seconds...")
 
-        start_time = time.time()
-        iteration = 0
-
         try:
-            while time.time() - start_time < duration:
-                iteration += 1
-                self.logger.info(f"--- Iteration {iteration} ---")
-
-                # Simulate each device
-                self.simulate_motion_sensor()
-                self.simulate_light_state("light1")
-                self.simulate_light_state("light2")
-                self.simulate_intercom()
-
-                # Wait 5-10 seconds between iterations (realistic interval)
-                wait_time = random.uniform(5, 10)
-                self.logger.info(f"Waiting {wait_time:.1f} seconds...")
-                time.sleep(wait_time)
+            asyncio.run(self._run_devices(duration))
 
         except KeyboardInterrupt:
             self.logger.info("Simulation interrupted by user")
@@ -172,10 +165,10 @@ class NormalBehaviorSimulator:
         self.logger.info("Simulation complete")
 
     def cleanup(self):
-        """Disconnect all clients."""
-        for name, client in self.clients.items():
-            self.logger.info(f"Disconnecting {name}")
-            client.disconnect()
+        """Disconnect the shared client."""
+        if self.client is not None:
+            self.logger.info("Disconnecting from broker")
+            self.client.disconnect()
 
 
 def main():
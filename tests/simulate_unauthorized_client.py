@@ -21,7 +21,7 @@ Expected Detection:
 WARNING: This is a security testing tool. Only use in authorized testing environments.
 
 Usage:
-    python3 simulate_unauthorized_client.py [--scenario SCENARIO]
+    python3 simulate_unauthorized_client.py [--scenario SCENARIO] [--parallel]
 
 Scenarios:
     auth_failure: Attempt connection with wrong credentials
@@ -31,8 +31,12 @@ Scenarios:
 
 import sys
 import time
+import functools
 import argparse
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, as_completed, wait
 from pathlib import Path
+from typing import Final, NamedTuple, Optional, Tuple
 
 # Add src directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
@@ -40,50 +44,106 @@ sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 from modules.mqtt_client import SecureMQTTClient
 from modules.logging_utils import get_logger
 
+# Broker connection settings shared by every simulated client
+_make_client = functools.partial(
+    SecureMQTTClient,
+    broker_host="192.168.1.10",
+    broker_port=1883,
+    username=None,
+    password=None,
+    ca_cert_path=None
+)
+
+# Topics a motion sensor must not publish to
+_UNAUTHORIZED_PUB_TOPICS: Final[Tuple[str, ...]] = (
+    "safenest/light1/set",  # Motion sensor shouldn't control lights
+    "safenest/system/command",  # Motion sensor shouldn't access system
+    "safenest/alerts/critical",  # Motion sensor shouldn't publish alerts
+    "safenest/intercom/event",  # Motion sensor shouldn't publish intercom events
+)
+
+# Topic filters a motion sensor must not subscribe to
+_UNAUTHORIZED_SUB_TOPICS: Final[Tuple[str, ...]] = (
+    "safenest/alerts/#",
+    "safenest/system/#",
+)
+
+# Topics probed by the topic scan (reconnaissance) scenario
+_SCAN_TOPICS: Final[Tuple[str, ...]] = (
+    "safenest/admin/config",
+    "safenest/system/users",
+    "safenest/backup/data",
+    "safenest/security/keys",
+    "safenest/camera/feed",
+    "safenest/motion/state",
+    "safenest/intercom/event",
+    "safenest/light2/state",
+    "$SYS/broker/clients/connected",  # System topic
+)
+
+
+class AuthAttemptResult(NamedTuple):
+    """Outcome of a single wrong-credential connection attempt."""
+    attempt: int
+    connected: bool
+    error: Optional[Exception]
+
 
 class UnauthorizedClientSimulator:
     """Simulates unauthorized access attempts."""
 
-    def __init__(self):
-        """Initialize simulator."""
+    def __init__(self, delay: float = 0.1):
+        """
+        Initialize simulator.
+
+        Args:
+            delay: Pause between auth attempts and between ACL test
+                requests in seconds
+        """
         self.logger = get_logger("simulator_unauthorized", console=True)
+        self.delay = delay
+
+    def _one_auth_attempt(self, i: int) -> AuthAttemptResult:
+        """Make a single connection attempt with wrong credentials."""
+        try:
+            client = _make_client(client_id=f"unauthorized_client_{i}")
+
+            # Try to connect (should fail)
+            connected = client.connect(retry=False)
+            if connected:
+                client.disconnect()
+            return AuthAttemptResult(i, connected, None)
+
+        except Exception as e:
+            return AuthAttemptResult(i, False, e)
 
     def test_auth_failure(self, attempts: int = 5):
         """
         Test authentication failure detection.
 
-        Attempts to connect with wrong credentials multiple times.
+        Attempts to connect with wrong credentials multiple times. Each
+        attempt uses its own client ID, so they run concurrently, started
+        `delay` apart; results are logged from this thread as they complete.
         """
         self.logger.warning("Testing authentication failure detection...")
 
-        for i in range(attempts):
-            self.logger.info(f"Auth attempt {i + 1}/{attempts}")
+        with ThreadPoolExecutor(max_workers=max(1, min(attempts, 16))) as executor:
+            futures = []
+            for i in range(attempts):
+                futures.append(executor.submit(self._one_auth_attempt, i))
+                time.sleep(self.delay)
 
-            try:
-                client = SecureMQTTClient(
-                    client_id=f"unauthorized_client_{i}",
-                    broker_host="192.168.1.10",
-                    broker_port=1883,
-                    username=None,
-                    password=None,
-                    ca_cert_path=None
-                )
+            for future in as_completed(futures):
+                result = future.result()
+                self.logger.info(f"Auth attempt {result.attempt + 1}/{attempts} finished")
 
-                # Try to connect (should fail)
-                connected = client.connect(retry=False)
-
-                if connected:
+                if result.error is not None:
+                    self.logger.info(f"Connection failed: {result.error} (expected)")
+                elif result.connected:
                     self.logger.error("UNEXPECTED: Connection succeeded with wrong credentials!")
-                    client.disconnect()
                 else:
                     self.logger.info("Connection rejected (expected)")
 
-            except Exception as e:
-                self.logger.info(f"Connection failed: {e} (expected)")
-
-            # Wait between attempts
-            time.sleep(2)
-
         self.logger.warning(
             f"Auth failure test complete: {attempts} attempts made. "
             "Check logs for detection."
@@ -99,14 +159,7 @@ class UnauthorizedClientSimulator:
 
         try:
             # Connect as motion sensor (limited permissions)
-            client = SecureMQTTClient(
-                client_id="acl_violator",
-                broker_host="192.168.1.10",
-                broker_port=1883,
-                username=None,
-                password=None,
-                ca_cert_path=None
-            )
+            client = _make_client(client_id="acl_violator")
 
             if not client.connect(retry=False):
                 self.logger.error("Failed to connect")
@@ -115,14 +168,7 @@ class UnauthorizedClientSimulator:
             self.logger.info("Connected as motion_user")
 
             # Attempt to publish to unauthorized topics
-            unauthorized_topics = [
-                "safenest/light1/set",  # Motion sensor shouldn't control lights
-                "safenest/system/command",  # Motion sensor shouldn't access system
-                "safenest/alerts/critical",  # Motion sensor shouldn't publish alerts
-                "safenest/intercom/event",  # Motion sensor shouldn't publish intercom events
-            ]
-
-            for topic in unauthorized_topics:
+            for topic in _UNAUTHORIZED_PUB_TOPICS:
                 self.logger.warning(f"Attempting unauthorized publish to: {topic}")
 
                 success = client.publish(topic, "unauthorized_payload", qos=1)
@@ -134,26 +180,28 @@ class UnauthorizedClientSimulator:
                 else:
                     self.logger.info(f"Publish blocked (expected)")
 
-                time.sleep(1)
+                time.sleep(self.delay)
 
             # Also try to subscribe to unauthorized topics
             self.logger.warning("Attempting unauthorized subscriptions...")
 
+            leaked = threading.Event()
+
             def dummy_callback(topic, payload):
+                leaked.set()
                 self.logger.error(f"UNEXPECTED: Received message from {topic}")
 
-            unauthorized_subs = [
-                "safenest/alerts/#",
-                "safenest/system/#",
-            ]
-
-            for topic in unauthorized_subs:
+            for topic in _UNAUTHORIZED_SUB_TOPICS:
                 self.logger.warning(f"Attempting unauthorized subscribe to: {topic}")
                 client.subscribe(topic, dummy_callback)
-                time.sleep(1)
+                time.sleep(self.delay)
 
-            # Wait a bit to see if subscriptions work
-            time.sleep(5)
+            # Wait up to 5 seconds to see if subscriptions work, returning
+            # as soon as the first leaked message arrives
+            if leaked.wait(timeout=5):
+                self.logger.error("LEAK: Unauthorized subscription delivered messages")
+            else:
+                self.logger.info("No messages received on unauthorized subscriptions (expected)")
 
             client.disconnect()
 
@@ -162,23 +210,21 @@ class UnauthorizedClientSimulator:
 
         self.logger.warning("ACL violation test complete. Check logs for detections.")
 
-    def test_topic_scan(self):
+    def test_topic_scan(self, pace: float = 0.0):
         """
         Test topic scanning detection.
 
         Attempt to discover and access multiple topics (reconnaissance behavior).
+
+        Args:
+            pace: Delay between scan publishes in seconds. The default of 0
+                sends the whole scan as one burst; a non-zero value spreads
+                it out to exercise the detector's rate heuristics.
         """
         self.logger.warning("Testing topic scanning detection...")
 
         try:
-            client = SecureMQTTClient(
-                client_id="topic_scanner",
-                broker_host="192.168.1.10",
-                broker_port=1883,
-                username=None,
-                password=None,
-                ca_cert_path=None
-            )
+            client = _make_client(client_id="topic_scanner")
 
             if not client.connect(retry=False):
                 self.logger.error("Failed to connect")
@@ -186,23 +232,14 @@ class UnauthorizedClientSimulator:
 
             self.logger.info("Connected as light1_user")
 
-            # Attempt to scan various topics
-            scan_topics = [
-                "safenest/admin/config",
-                "safenest/system/users",
-                "safenest/backup/data",
-                "safenest/security/keys",
-                "safenest/camera/feed",
-                "safenest/motion/state",
-                "safenest/intercom/event",
-                "safenest/light2/state",
-                "$SYS/broker/clients/connected",  # System topic
-            ]
-
-            for topic in scan_topics:
-                self.logger.info(f"Scanning topic: {topic}")
-                client.publish(topic, "scan", qos=0)
-                time.sleep(0.5)
+            # Attempt to scan various topics. QoS 0 publishes need no PUBACK,
+            # so unless pacing was requested they are queued back to back and
+            # the network loop flushes them together
+            self.logger.info(f"Scanning {len(_SCAN_TOPICS)} topics: {', '.join(_SCAN_TOPICS)}")
+            for topic in _SCAN_TOPICS:
+                client.publish(topic, b"scan", qos=0)
+                if pace:
+                    time.sleep(pace)
 
             client.disconnect()
 
@@ -220,14 +257,7 @@ class UnauthorizedClientSimulator:
         self.logger.warning("Testing unknown client detection...")
 
         try:
-            client = SecureMQTTClient(
-                client_id="unknown_device_12345",
-                broker_host="192.168.1.10",
-                broker_port=1883,
-                username=None,
-                password=None,
-                ca_cert_path=None
-            )
+            client = _make_client(client_id="unknown_device_12345")
 
             connected = client.connect(retry=False)
 
@@ -261,6 +291,31 @@ def main():
         default=5,
         help="Number of failed auth attempts (default: 5)"
     )
+    parser.add_argument(
+        "--parallel",
+        action="store_true",
+        help="Run all scenarios concurrently instead of one after another "
+             "(the log watcher may block this IP sooner)"
+    )
+    parser.add_argument(
+        "--scenario-stagger-ms",
+        type=int,
+        default=500,
+        help="Offset between scenario starts in --parallel mode so their log "
+             "lines stay distinguishable by timestamp (default: 500)"
+    )
+    parser.add_argument(
+        "--pace-ms",
+        type=int,
+        default=0,
+        help="Delay between topic scan publishes in milliseconds (default: 0, one burst)"
+    )
+    parser.add_argument(
+        "--delay-ms",
+        type=int,
+        default=100,
+        help="Delay between auth attempts and ACL test requests in milliseconds (default: 100)"
+    )
 
     args = parser.parse_args()
 
@@ -277,14 +332,29 @@ def main():
         print("Aborted.")
         return
 
-    simulator = UnauthorizedClientSimulator()
-
-    if args.scenario == "all":
+    simulator = UnauthorizedClientSimulator(delay=args.delay_ms / 1000)
+
+    if args.scenario == "all" and args.parallel:
+        scenarios = [
+            functools.partial(simulator.test_auth_failure, attempts=args.auth_attempts),
+            simulator.test_acl_violation,
+            functools.partial(simulator.test_topic_scan, pace=args.pace_ms / 1000),
+            simulator.test_unknown_client,
+        ]
+        with ThreadPoolExecutor(max_workers=len(scenarios)) as executor:
+            futures = []
+            for scenario in scenarios:
+                futures.append(executor.submit(scenario))
+                time.sleep(args.scenario_stagger_ms / 1000)
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in done:
+                future.result()
+    elif args.scenario == "all":
         simulator.test_auth_failure(attempts=args.auth_attempts)
         time.sleep(3)
         simulator.test_acl_violation()
         time.sleep(3)
-        simulator.test_topic_scan()
+        simulator.test_topic_scan(pace=args.pace_ms / 1000)
         time.sleep(3)
         simulator.test_unknown_client()
     elif args.scenario == "auth_failure":
@@ -292,7 +362,7 @@ def main():
     elif args.scenario == "acl_violation":
         simulator.test_acl_violation()
     elif args.scenario == "topic_scan":
-        simulator.test_topic_scan()
+        simulator.test_topic_scan(pace=args.pace_ms / 1000)
     elif args.scenario == "unknown_client":
         simulator.test_unknown_client()
 
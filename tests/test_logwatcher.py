@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+"""
+Unit tests for SafeNest Log Watcher event classification.
+
+Usage:
+    python3 -m unittest discover tests
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+# Add src directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from safenest_logwatcher import LogWatcher
+
+
+class ClassifyEventTest(unittest.TestCase):
+    """LogWatcher._classify_event keyword matching and priority."""
+
+    def test_single_keyword(self):
+        self.assertEqual(
+            LogWatcher._classify_event(b"Client 10.0.0.5 bad username or password"),
+            "AUTH_FAILURE"
+        )
+        self.assertEqual(
+            LogWatcher._classify_event(b"DOS_ATTACK_DETECTED from 10.0.0.5"),
+            "DOS_ATTACK"
+        )
+        self.assertEqual(
+            LogWatcher._classify_event(b"ACL denied for 10.0.0.5"),
+            "UNAUTHORIZED_ACCESS"
+        )
+
+    def test_no_event(self):
+        self.assertIsNone(LogWatcher._classify_event(b"New connection from 10.0.0.5"))
+
+    def test_mixed_keywords_use_baseline_priority(self):
+        # Leftmost keyword is UNAUTHORIZED_, but auth failures take priority
+        line = b"UNAUTHORIZED_TOPIC from 10.0.0.5: connection refused"
+        self.assertEqual(LogWatcher._classify_event(line), "AUTH_FAILURE")
+
+        line = b"UNAUTHORIZED_TOPIC 10.0.0.5 message flooding"
+        self.assertEqual(LogWatcher._classify_event(line), "DOS_ATTACK")
+
+        line = b"rate limit exceeded; 10.0.0.5 not authorized"
+        self.assertEqual(LogWatcher._classify_event(line), "AUTH_FAILURE")
+
+
+if __name__ == "__main__":
+    unittest.main()